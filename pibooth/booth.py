@@ -27,7 +27,7 @@ from pibooth.states import StateMachine
 from pibooth.plugins import create_plugin_manager
 from pibooth.view import PiWindow
 from pibooth.config import PiConfigParser, PiConfigMenu
-from pibooth.printer import PRINTER_TASKS_UPDATED, Printer
+from pibooth.printer import PRINTER_TASKS_UPDATED, Printer, get_paper_format
 
 
 # Set the default pin factory to a mock factory if pibooth is not started a Raspberry Pi
@@ -143,7 +143,9 @@ class PiApplication(object):
         self.printer = Printer(config.get('PRINTER', 'printer_name'),
                                config.getint('PRINTER', 'max_pages'),
                                config.gettyped('PRINTER', 'printer_options'),
-                               self.count)
+                               self.count,
+                               paper_format=get_paper_format(config.get('PRINTER', 'paper_format')),
+                               dpi=config.getint('PRINTER', 'dpi'))
         # ---------------------------------------------------------------------
 
     def _initialize(self):
@@ -193,6 +195,8 @@ class PiApplication(object):
 
         # Reset the print counter (in case of max_pages is reached)
         self.printer.max_pages = self._config.getint('PRINTER', 'max_pages')
+        self.printer.paper_format = get_paper_format(self._config.get('PRINTER', 'paper_format'))
+        self.printer.dpi = self._config.getint('PRINTER', 'dpi')
 
     def _on_button_capture_held(self):
         """Called when the capture button is pressed.
@@ -464,8 +468,9 @@ def main():
     LOGGER.info("Installed plugins: %s", ", ".join(
         [plugin_manager.get_friendly_name(p) for p in plugin_manager.list_external_plugins()]))
 
-    # Load the languages
+    # Load the languages and the fonts sizes index
     language.init(config.join_path("translations.cfg"), options.reset)
+    fonts.init(config.join_path("fonts.json"), options.reset)
 
     # Update configuration with plugins ones
     plugin_manager.hook.pibooth_configure(cfg=config)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import pygame
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw
 
 from pibooth import fonts
@@ -15,6 +16,8 @@ class BaseCamera(object):
         self._window = None
         self._overlay = None
         self._captures = []
+        self._processing = []  # Futures of the captures post-processed in background
+        self._worker = ThreadPoolExecutor(max_workers=1)
 
         self.resolution = None
         self.delete_internal_memory = False
@@ -62,6 +65,28 @@ class BaseCamera(object):
         """
         raise NotImplementedError
 
+    def _retrieve_capture(self, capture_data):
+        """Get from the camera everything needed to post-process the capture
+        data (called from the main thread, before post-processing in the
+        background).
+        """
+        pass
+
+    def _process_capture(self, capture_data):
+        """Return a couple (image, data) from capture data.
+        """
+        raw_data = self._get_raw_capture(capture_data)
+        image = self._post_process_capture(capture_data)
+        image.load()  # Decode now if the image was lazily opened
+        return image, raw_data
+
+    def _get_raw_capture(self, capture_data):
+        """Return the original encoded (JPEG) data of the capture if they can
+        be saved as is (pixels not modified or only rotated/flipped thanks to
+        the EXIF orientation), else None.
+        """
+        return None
+
     def get_rect(self, max_size=None):
         """Return a Rect object (as defined in pygame) for resizing preview and images
         in order to fit to the defined window.
@@ -116,12 +141,41 @@ class BaseCamera(object):
         """
         raise NotImplementedError
 
-    def get_captures(self):
+    def post_process_async(self):
+        """Start the post-processing of the captures taken since last call
+        in a background thread. The results are collected by
+        :py:meth:`get_captures`.
+        """
+        for capture_data in self._captures[len(self._processing):]:
+            self._retrieve_capture(capture_data)
+            self._processing.append(self._worker.submit(self._process_capture, capture_data))
+
+    def get_capture(self, index):
+        """Return the capture of the given index post-processed in background
+        (wait for the end of its post-processing). The capture is kept in the
+        buffer.
+
+        :param index: index of the capture
+        :type index: int
+        """
+        if index >= len(self._processing):
+            raise IndexError("Capture {} is not post-processed in background".format(index))
+        return self._processing[index].result()[0]
+
+    def get_captures(self, raw=False):
         """Return all buffered captures as PIL images (buffer dropped after call).
+
+        :param raw: if True, return couples (image, data) where data are the
+                    original encoded capture or None if not available
+        :type raw: bool
         """
         images = []
-        for data in self._captures:
-            images.append(self._post_process_capture(data))
+        for index, data in enumerate(self._captures):
+            if index < len(self._processing):
+                image, raw_data = self._processing[index].result()
+            else:
+                image, raw_data = self._process_capture(data)
+            images.append((image, raw_data) if raw else image)
         self.drop_captures()
         return images
 
@@ -129,6 +183,7 @@ class BaseCamera(object):
         """Delete all buffered captures.
         """
         self._captures.clear()
+        self._processing = []
 
     def quit(self):
         """Close the camera driver, it's definitive.
@@ -8,7 +8,8 @@ try:
 except ImportError:
     gp = None  # gphoto2 is optional
 from PIL import Image, ImageFilter
-from pibooth.pictures import sizing
+from pibooth.pictures import sizing, open_image
+from pibooth.pictures.exif import get_orientation, set_jpeg_orientation
 from pibooth.utils import LOGGER, PoolingTimer, pkill
 from pibooth.language import get_translated_text
 from pibooth.camera.base import BaseCamera
@@ -83,6 +84,7 @@ class GpCamera(BaseCamera):
         self._gp_logcb = None
         self._preview_compatible = True
         self._preview_viewfinder = False
+        self._downloads = {}
 
     def _specific_initialization(self):
         """Camera initialization.
@@ -121,13 +123,23 @@ class GpCamera(BaseCamera):
             return image.transpose(Image.ROTATE_270)
         return image
 
+    def _get_decoding_size(self, size, rotation):
+        """Return the minimal size of the image to decode from the camera
+        to get the given size after rotation.
+        """
+        if rotation in (90, 270):
+            return (size[1], size[0])
+        return size
+
     def _get_preview_image(self):
         """Capture a new preview image.
         """
         rect = self.get_rect()
         if self._preview_compatible:
             cam_file = self._cam.capture_preview()
-            image = Image.open(io.BytesIO(cam_file.get_data_and_size()))
+            size = sizing.new_size_keep_aspect_ratio(self.resolution, (rect.width, rect.height), 'outer')
+            image = open_image(io.BytesIO(cam_file.get_data_and_size()),
+                               self._get_decoding_size(size, self.preview_rotation))
             image = self._rotate_image(image, self.preview_rotation)
             # Crop to keep aspect ratio of the resolution
             image = image.crop(sizing.new_size_by_croping_ratio(image.size, self.resolution))
@@ -143,6 +155,49 @@ class GpCamera(BaseCamera):
             image.paste(self._overlay, (0, 0), self._overlay)
         return image
 
+    def _download_capture(self, gp_path):
+        """Return the JPEG data of the capture stored on the camera. The
+        data are kept until the capture is post-processed.
+        """
+        key = (gp_path.folder, gp_path.name)
+        # Buffered captures may be dropped by the main thread at any time
+        data = self._downloads.get(key)
+        if data is None:
+            camera_file = self._cam.file_get(gp_path.folder, gp_path.name, gp.GP_FILE_TYPE_NORMAL)
+            if self.delete_internal_memory:
+                LOGGER.debug("Delete capture '%s' from internal memory", gp_path.name)
+                self._cam.file_delete(gp_path.folder, gp_path.name)
+            data = bytes(camera_file.get_data_and_size())
+            self._downloads[key] = data
+        return data
+
+    def _retrieve_capture(self, capture_data):
+        """Download the capture from the camera.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        self._download_capture(capture_data[0])
+
+    def _get_raw_capture(self, capture_data):
+        """Return the JPEG data downloaded from the camera if no crop and no
+        effect is needed. Rotation and flip are defined by EXIF orientation.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        gp_path, effect = capture_data
+        data = self._download_capture(gp_path)
+        if effect != 'none':
+            return None
+
+        size = Image.open(io.BytesIO(data)).size
+        if self.capture_rotation in (90, 270):
+            size = (size[1], size[0])
+        if sizing.new_size_by_croping_ratio(size, self.resolution) != (0, 0) + size:
+            return None
+        return set_jpeg_orientation(data, get_orientation(self.capture_rotation, self.capture_flip))
+
     def _post_process_capture(self, capture_data):
         """Rework capture data.
 
@@ -150,11 +205,9 @@ class GpCamera(BaseCamera):
         :type capture_data: tuple
         """
         gp_path, effect = capture_data
-        camera_file = self._cam.file_get(gp_path.folder, gp_path.name, gp.GP_FILE_TYPE_NORMAL)
-        if self.delete_internal_memory:
-            LOGGER.debug("Delete capture '%s' from internal memory", gp_path.name)
-            self._cam.file_delete(gp_path.folder, gp_path.name)
-        image = Image.open(io.BytesIO(camera_file.get_data_and_size()))
+        data = self._download_capture(gp_path)
+        self._downloads.pop((gp_path.folder, gp_path.name), None)
+        image = open_image(io.BytesIO(data), self._get_decoding_size(self.resolution, self.capture_rotation))
         image = self._rotate_image(image, self.capture_rotation)
 
         # Crop to keep aspect ratio of the resolution
@@ -303,6 +356,12 @@ class GpCamera(BaseCamera):
 
         self._hide_overlay()  # If stop_preview() has not been called
 
+    def drop_captures(self):
+        """Delete all buffered captures.
+        """
+        super(GpCamera, self).drop_captures()
+        self._downloads.clear()
+
     def quit(self):
         """Close the camera driver, it's definitive.
         """
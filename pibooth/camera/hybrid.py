@@ -33,6 +33,22 @@ class HybridRpiCamera(RpiCamera):
         """
         return self._gp_cam._post_process_capture(capture_data)
 
+    def _retrieve_capture(self, capture_data):
+        """Download the capture from the camera.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        self._gp_cam._retrieve_capture(capture_data)
+
+    def _get_raw_capture(self, capture_data):
+        """Return the original capture data.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        return self._gp_cam._get_raw_capture(capture_data)
+
     def capture(self, effect=None):
         """Capture a picture in a file.
         """
@@ -40,6 +56,12 @@ class HybridRpiCamera(RpiCamera):
 
         self._hide_overlay()  # If stop_preview() has not been called
 
+    def drop_captures(self):
+        """Delete all buffered captures.
+        """
+        super(HybridRpiCamera, self).drop_captures()
+        self._gp_cam.drop_captures()
+
     def quit(self):
         """Close the camera driver, it's definitive.
         """
@@ -75,6 +97,22 @@ class HybridCvCamera(CvCamera):
         """
         return self._gp_cam._post_process_capture(capture_data)
 
+    def _retrieve_capture(self, capture_data):
+        """Download the capture from the camera.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        self._gp_cam._retrieve_capture(capture_data)
+
+    def _get_raw_capture(self, capture_data):
+        """Return the original capture data.
+
+        :param capture_data: couple (GPhotoPath, effect)
+        :type capture_data: tuple
+        """
+        return self._gp_cam._get_raw_capture(capture_data)
+
     def capture(self, effect=None):
         """Capture a picture in a file.
         """
@@ -82,6 +120,12 @@ class HybridCvCamera(CvCamera):
 
         self._hide_overlay()  # If stop_preview() has not been called
 
+    def drop_captures(self):
+        """Delete all buffered captures.
+        """
+        super(HybridCvCamera, self).drop_captures()
+        self._gp_cam.drop_captures()
+
     def quit(self):
         """Close the camera driver, it's definitive.
         """
@@ -3,12 +3,12 @@
 import time
 import subprocess
 from io import BytesIO
-from PIL import Image
 try:
     import picamera
 except ImportError:
     picamera = None  # picamera is optional
 from pibooth.language import get_translated_text
+from pibooth.pictures import open_image
 from pibooth.camera.base import BaseCamera
 
 
@@ -83,7 +83,16 @@ class RpiCamera(BaseCamera):
         """
         # "Rewind" the stream to the beginning so we can read its content
         capture_data.seek(0)
-        return Image.open(capture_data)
+        return open_image(capture_data, self.resolution)
+
+    def _get_raw_capture(self, capture_data):
+        """Return the JPEG data captured by the camera (rotation, flip and
+        effect are applied by the camera itself).
+
+        :param capture_data: binary data as stream
+        :type capture_data: :py:class:`io.BytesIO`
+        """
+        return capture_data.getvalue()
 
     def preview(self, window, flip=True):
         """Display a preview on the given Rect (flip if necessary).
@@ -142,7 +142,7 @@ DEFAULT = odict((
                  "Crop captures",  ['True', 'False'])),
             ("margin_thick",
                 (100,
-                 "Thick (in pixels) between captures and picture borders/texts",
+                 "Thick (in pixels at 600 dpi) between captures and picture borders/texts",
                  "Borders width", [str(i) for i in range(0, 210, 10)])),
             ("footer_text1",
                 ("Footer 1",
@@ -172,6 +172,22 @@ DEFAULT = odict((
                 ((255, 255, 255),
                  "Background RGB color or image path (list of tuples or quoted paths accepted)",
                  None, None)),
+            ("memory_limit",
+                (0,
+                 "Maximum memory (in MB) used by each temporary image to generate a picture, bigger ones are processed by bands (0 for no limit)",
+                 None, None)),
+            ("cache_size",
+                (0,
+                 "Memory (in MB) used by each process (main one and each pool worker) to keep resized backgrounds and overlays between pictures (0 to fit the pictures size in a quarter of the available memory)",
+                 None, None)),
+            ("pool_size",
+                (0,
+                 "Number of processes used to generate pictures in background (0 for number of CPUs, maximum 4)",
+                 None, None)),
+            ("pool_max_tasks",
+                (0,
+                 "Number of pictures generated by a process before replacing it by a fresh one (0 to never replace it)",
+                 None, None)),
         ))
      ),
     ("CAMERA",
@@ -208,6 +224,14 @@ DEFAULT = odict((
                 ({},
                  "Print options passed to the printer, shall be a valid Python dictionary",
                  None, None)),
+            ("paper_format",
+                ("4x6",
+                 "Printable area in inches (e.g. 4x6 or 3.9x5.8) used if not given by the printer driver",
+                 None, None)),
+            ("dpi",
+                (600,
+                 "Resolution of the printed pictures (dots per inch) used if not given by the printer driver",
+                 None, None)),
             ("printer_delay",
                 (10,
                  "How long is the print view in seconds (0 to skip it)",
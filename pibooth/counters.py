@@ -1,16 +1,105 @@
 # -*- coding: utf-8 -*-
 
+import os
+import zlib
+import fcntl
 import pickle
+import struct
 import os.path as osp
+from contextlib import contextmanager
+from pibooth.utils import LOGGER
+
+# Journal record: counter name, value, sequence number, flags, CRC32
+RECORD = struct.Struct('<32sqQBI')
+
+# Flag of the records followed by other records of the same transaction
+FLAG_BATCH = 0x01
+
+
+def pack_record(name, value, seq, flags=0):
+    """Return the journal record of a counter update.
+
+    :param name: counter name
+    :type name: str
+    :param value: new value of the counter
+    :type value: int
+    :param seq: sequence number of the record
+    :type seq: int
+    :param flags: record flags
+    :type flags: int
+
+    :return: record of ``RECORD.size`` bytes
+    :rtype: bytes
+    """
+    name = name.encode('utf-8')
+    if len(name) > 32:
+        raise ValueError("Counter name '{}' is too long".format(name.decode('utf-8')))
+    data = RECORD.pack(name, value, seq, flags, 0)[:-4]
+    return data + struct.pack('<I', zlib.crc32(data))
+
+
+def iter_records(data):
+    """Yield the (name, value, seq, flags) of the valid records. Iteration
+    stops at the first truncated or corrupted record (interrupted write).
+
+    :param data: journal content
+    :type data: bytes
+    """
+    for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+        name, value, seq, flags, crc = RECORD.unpack_from(data, offset)
+        if zlib.crc32(data[offset:offset + RECORD.size - 4]) != crc:
+            LOGGER.warning("Corrupted counters journal record at offset %s", offset)
+            return
+        yield name.rstrip(b'\x00').decode('utf-8'), value, seq, flags
+
+
+def _write_atomic(path, data):
+    """Write data in a temporary file, then rename it (the file is always
+    complete, even after a power cut).
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
 
 
 class Counters(object):
 
-    def __init__(self, filename='', **kwargs):
+    """Integer counters persisted in a file. Each update is appended to a
+    journal (``<filename>.journal``) of fixed-size records which is
+    periodically compacted in the snapshot file (atomically replaced). The
+    snapshot is the pickled dict of the counters (readable by the previous
+    versions) followed by the pickled sequence number of its last update.
+
+    Several updates done in a :py:meth:`transaction` are written at once and
+    are applied together when reading the journal. Readers (for instance
+    ``pibooth-count``) can load the counters while the writer is running.
+    Writers are serialized by a lock file (``<filename>.lock``): when the
+    counters were updated by another writer, they are reloaded and the
+    pending increments are applied to the reloaded values.
+
+    :param filename: path to the snapshot file
+    :type filename: str
+    :param max_records: number of records in journal before compaction
+    :type max_records: int
+    :param kwargs: counters names and default values
+    :type kwargs: int
+    """
+
+    def __init__(self, filename='', max_records=100, **kwargs):
         self.data = kwargs.copy()
         self.default = kwargs
         self.filename = osp.abspath(osp.expanduser(filename))
-        if osp.isfile(self.filename):
+        self.journal = self.filename + '.journal'
+        self.lockfile = self.filename + '.lock'
+        self.max_records = max_records
+        self._seq = 0  # Sequence number of the last record
+        self._records = 0  # Number of records in the journal
+        self._fd = None  # Journal opened for writing
+        self._batch = None  # Records of the current transaction
+        if osp.isfile(self.filename) or osp.isfile(self.journal):
             self.load()
 
     def __str__(self):
@@ -37,8 +126,9 @@ class Counters(object):
         """Called each time an attribute is set.
         """
         if name != 'data' and name in self.data:
+            delta = value - self.data[name]
             self.data[name] = value
-            self.save()
+            self._write(name, value, delta)
         else:
             super(Counters, self).__setattr__(name, value)
 
@@ -47,11 +137,127 @@ class Counters(object):
         """
         return [key for key in self.data]
 
-    def load(self):
-        """Load the saved counters.
+    def _read_snapshot(self):
+        """Return the sequence number and the counters of the snapshot.
         """
+        if not osp.isfile(self.filename):
+            return 0, {}
         with open(self.filename, 'rb') as fp:
-            self.data.update(pickle.load(fp))
+            data = pickle.load(fp)
+            try:
+                seq = pickle.load(fp)
+            except EOFError:
+                seq = 0  # Written by an old version (no journal)
+        return seq, data
+
+    def load(self):
+        """Load the saved counters: the snapshot, then the complete
+        transactions of the journal which are more recent.
+        """
+        for _ in range(10):
+            seq, data = self._read_snapshot()
+            try:
+                with open(self.journal, 'rb') as fp:
+                    records = list(iter_records(fp.read()))
+            except FileNotFoundError:
+                records = []
+            if not records or records[0][2] <= seq + 1:
+                break
+            # Journal compacted by the writer since the snapshot was read
+        else:
+            raise IOError("Can not read consistent counters from '{}'".format(self.filename))
+
+        batch = {}
+        for name, value, record_seq, flags in records:
+            if record_seq <= seq:
+                continue  # Already in the snapshot
+            batch[name] = value
+            if not flags & FLAG_BATCH:  # End of transaction
+                data.update(batch)
+                batch = {}
+                seq = record_seq
+        self.data.update(data)
+        self._seq = seq
+        self._records = len(records)
+
+    def _write(self, name, value, delta):
+        """Append the record of an updated counter to the journal (or to the
+        current transaction).
+        """
+        if self._batch is not None:
+            self._batch.append((name, value, delta))
+        else:
+            self._append([(name, value, delta)])
+
+    @contextmanager
+    def _lock(self):
+        """Context manager holding the lock of the writers.
+        """
+        fd = os.open(self.lockfile, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Release the lock
+
+    def _is_journal_changed(self):
+        """Return True if the journal was replaced or written by another
+        writer since the last write.
+        """
+        try:
+            stat = os.stat(self.journal)
+        except FileNotFoundError:
+            return True
+        return stat.st_ino != os.fstat(self._fd).st_ino or stat.st_size != self._records * RECORD.size
+
+    def _append(self, updates):
+        """Write the records of the given (name, value, increment) updates to
+        the journal at once.
+        """
+        with self._lock():
+            if self._fd is None or self._is_journal_changed():
+                if self._fd is not None:
+                    LOGGER.info("Counters updated by another process, reload them")
+                    os.close(self._fd)
+                    self._fd = None
+                for name, _, delta in reversed(updates):
+                    self.data[name] -= delta  # Value before the pending updates
+                self.load()  # Updates of the other writers
+                for index, (name, _, delta) in enumerate(updates):
+                    self.data[name] += delta
+                    updates[index] = (name, self.data[name], delta)
+                self._save()  # Start from a clean journal (no interrupted record)
+            records = []
+            for index, (name, value, _) in enumerate(updates):
+                self._seq += 1
+                records.append(pack_record(name, value, self._seq,
+                                           FLAG_BATCH if index < len(updates) - 1 else 0))
+            os.write(self._fd, b''.join(records))
+            os.fsync(self._fd)
+            self._records += len(records)
+            if self._records >= self.max_records:
+                self._save()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager grouping the updates of several counters: they
+        are written when leaving the context. If an exception occurs, the
+        counters are restored and nothing is written.
+        """
+        if self._batch is not None:
+            yield self  # Nested transaction, merged in the current one
+            return
+        data = self.data.copy()
+        self._batch = []
+        try:
+            yield self
+            if self._batch:
+                self._append(self._batch)
+        except Exception:
+            self.data = data
+            raise
+        finally:
+            self._batch = None
 
     def reset(self):
         """Reset all counters.
@@ -60,7 +266,20 @@ class Counters(object):
         self.save()
 
     def save(self):
-        """Save the current counters in a file.
+        """Save the current counters in the snapshot file and start a new
+        journal (compaction).
+        """
+        with self._lock():
+            self._save()
+
+    def _save(self):
+        """Save the counters, the lock of the writers shall be held.
         """
-        with open(self.filename, 'wb') as fp:
-            pickle.dump(self.data, fp, pickle.HIGHEST_PROTOCOL)
+        self._seq += 1  # Records of the previous journal are older
+        _write_atomic(self.filename, pickle.dumps(self.data, pickle.HIGHEST_PROTOCOL)
+                      + pickle.dumps(self._seq, pickle.HIGHEST_PROTOCOL))
+        _write_atomic(self.journal, b'')
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.journal, os.O_WRONLY | os.O_APPEND)
+        self._records = 0
@@ -2,14 +2,37 @@
 
 import os
 import os.path as osp
+import json
+import atexit
 import fnmatch
+import threading
+from collections import OrderedDict
 from difflib import SequenceMatcher
 import pygame
 from PIL import ImageFont
+from pibooth.utils import LOGGER
 
 
 EMBEDDED_FONT_PATH = osp.dirname(osp.abspath(__file__))
 
+# Maximum number of loaded fonts kept in memory
+FACES_CACHE_SIZE = 32
+
+# Maximum number of fitted sizes kept in the index
+INDEX_MAX_ENTRIES = 1000
+
+# Delay in seconds before saving the index once it is updated
+INDEX_SAVE_DELAY = 10
+
+INDEX = OrderedDict()  # Fitted font sizes: key -> size
+INDEX_FILENAME = None  # Dynamically set at startup
+
+_FACES = OrderedDict()
+_FACES_LOCK = threading.Lock()
+_INDEX_LOCK = threading.Lock()
+_SAVE_LOCK = threading.Lock()
+_SAVE_TIMER = None  # Pending save of the updated index
+
 
 def get_available_fonts():
     """Return the list of available fonts.
@@ -53,6 +76,130 @@ def get_filename(name):
     raise ValueError('System font "{0}" unknown, maybe you mean "{1}"'.format(name, most_similar))
 
 
+def init(filename, clear=False):
+    """Initialize the fonts sizes index persisted in the given file.
+
+    :param filename: path to the index file
+    :type filename: str
+    :param clear: if True, the index is regenerated
+    :type clear: bool
+    """
+    global INDEX_FILENAME
+    if INDEX_FILENAME is None:
+        atexit.register(save)
+    save()  # Pending updates of the previous index
+    with _INDEX_LOCK:
+        INDEX_FILENAME = osp.abspath(osp.expanduser(filename))
+        INDEX.clear()
+        if osp.isfile(INDEX_FILENAME) and not clear:
+            try:
+                with open(INDEX_FILENAME, 'r') as fp:
+                    INDEX.update(json.load(fp))
+            except ValueError:
+                LOGGER.warning("Invalid fonts index '%s', it will be regenerated", INDEX_FILENAME)
+
+
+def _schedule_save():
+    """Save the index after :py:data:`INDEX_SAVE_DELAY` seconds in a
+    background thread (the updates done meanwhile are saved at once).
+    """
+    global _SAVE_TIMER
+    with _SAVE_LOCK:
+        if _SAVE_TIMER is None:
+            _SAVE_TIMER = threading.Timer(INDEX_SAVE_DELAY, save)
+            _SAVE_TIMER.daemon = True
+            _SAVE_TIMER.start()
+
+
+def save():
+    """Save the fonts sizes index in its file if it has been updated since
+    the last save (and if initialized). Also called at exit.
+    """
+    global _SAVE_TIMER
+    with _SAVE_LOCK:
+        if _SAVE_TIMER is None:
+            return  # Not updated
+        _SAVE_TIMER.cancel()
+        _SAVE_TIMER = None
+        with _INDEX_LOCK:
+            filename = INDEX_FILENAME
+            index = dict(INDEX)
+        if not filename:
+            return
+        dirname = osp.dirname(filename)
+        if not osp.isdir(dirname):
+            os.makedirs(dirname)
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as fp:
+            json.dump(index, fp)
+        os.replace(tmp_filename, filename)
+
+
+def _load_face(engine, font_name, size):
+    """Load the font object for the given engine ('pil' or 'pygame')
+    without caching it.
+    """
+    if engine == 'pil':
+        return ImageFont.truetype(font_name, size)
+    return pygame.font.Font(font_name, size)
+
+
+def _get_face(engine, font_name, size):
+    """Return the font object for the given engine ('pil' or 'pygame'),
+    loaded fonts are cached.
+    """
+    key = (engine, font_name, size)
+    with _FACES_LOCK:
+        if key in _FACES:
+            _FACES.move_to_end(key)
+            return _FACES[key]
+        font = _load_face(engine, font_name, size)
+        _FACES[key] = font
+        while len(_FACES) > FACES_CACHE_SIZE:
+            _FACES.popitem(last=False)
+        return font
+
+
+def _get_fitted_size(engine, text, font_name, max_width, max_height, get_size):
+    """Return the biggest font size which fit the text in the given rectangle.
+    The result is memoized in the index.
+
+    :param get_size: function returning (width, height) of the text for a font
+    :type get_size: callable
+    """
+    max_width, max_height = int(max_width), int(max_height)
+    mtime = osp.getmtime(font_name) if osp.isfile(font_name) else ''
+    key = '|'.join((engine, font_name, str(mtime), str(max_width), str(max_height), text))
+    with _INDEX_LOCK:
+        if key in INDEX:
+            INDEX.move_to_end(key)
+            return INDEX[key]
+
+    # Probed faces are not cached to keep the LRU for the sizes really used
+    start, end = 0, int(max_height * 2)
+    while start < end:
+        k = (start + end) // 2
+        font_size = get_size(_load_face(engine, font_name, k))
+        if font_size[0] > max_width or font_size[1] > max_height:
+            end = k
+        else:
+            start = k + 1
+
+    with _INDEX_LOCK:
+        INDEX[key] = start
+        while len(INDEX) > INDEX_MAX_ENTRIES:
+            INDEX.popitem(last=False)
+    _schedule_save()
+    return start
+
+
+def _get_pil_text_size(font, text):
+    """Return the size of the text drawn with the PIL font.
+    """
+    bbox = font.getbbox(text)
+    return (bbox[2] - bbox[0], bbox[3] - bbox[1])
+
+
 def get_pil_font(text, font_name, max_width, max_height):
     """Create the PIL font object which fit the text to the given rectangle.
 
@@ -68,17 +215,9 @@ def get_pil_font(text, font_name, max_width, max_height):
     :return: PIL.Font instance
     :rtype: object
     """
-    start, end = 0, int(max_height * 2)
-    while start < end:
-        k = (start + end) // 2
-        font = ImageFont.truetype(font_name, k)
-        bbox = font.getbbox(text)
-        font_size = (bbox[2] - bbox[0], bbox[3] - bbox[1])
-        if font_size[0] > max_width or font_size[1] > max_height:
-            end = k
-        else:
-            start = k + 1
-    return ImageFont.truetype(font_name, start)
+    size = _get_fitted_size('pil', text, font_name, max_width, max_height,
+                            lambda font: _get_pil_text_size(font, text))
+    return _get_face('pil', font_name, size)
 
 
 def get_pygame_font(text, font_name, max_width, max_height):
@@ -96,17 +235,10 @@ def get_pygame_font(text, font_name, max_width, max_height):
     :return: pygame.Font instance
     :rtype: object
     """
-    start, end = 0, int(max_height * 2)
-    while start < end:
-        k = (start + end) // 2
-        font = pygame.font.Font(get_filename(font_name), k)
-        font_size = font.size(text)
-        if font_size[0] > max_width or font_size[1] > max_height:
-            end = k
-        else:
-            start = k + 1
-        del font  # Run garbage collector, to avoid opening too many files
-    return pygame.font.Font(get_filename(font_name), start)
+    font_name = get_filename(font_name)
+    size = _get_fitted_size('pygame', text, font_name, max_width, max_height,
+                            lambda font: font.size(text))
+    return _get_face('pygame', font_name, size)
 
 
 CURRENT = get_filename('Amatic-Bold')  # Dynamically set at startup
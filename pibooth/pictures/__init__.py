@@ -8,12 +8,16 @@ from pibooth import language
 from pibooth import fonts
 from pibooth.pictures import factory
 from pibooth.pictures import sizing
+from pibooth.pictures.exif import ORIENTATION_TAG
 
 
 AUTO = 'auto'
 PORTRAIT = 'portrait'
 LANDSCAPE = 'landscape'
 
+# Resolution of the sizes in pixels defined in the configuration
+REFERENCE_DPI = 600
+
 
 def get_filename(name):
     """Return absolute path to a picture located in the current package.
@@ -27,6 +31,96 @@ def get_filename(name):
     return osp.join(osp.dirname(osp.abspath(__file__)), 'assets', name)
 
 
+def draft_image(image, size):
+    """Configure a not yet loaded JPEG image to be decoded at the smallest
+    scale (1/2, 1/4 or 1/8 using DCT scaling) giving an image bigger than
+    the given size. Nothing is done for other formats or loaded images.
+
+    :param image: PIL image returned by :py:func:`PIL.Image.open`
+    :type image: :py:class:`PIL.Image`
+    :param size: minimal size (width, height) to cover
+    :type size: tuple
+
+    :return: the image itself
+    :rtype: :py:class:`PIL.Image`
+    """
+    if size and image.format == 'JPEG':
+        image.draft(None, sizing.new_size_keep_aspect_ratio(image.size, size, 'outer'))
+    return image
+
+
+def get_file_orientation(image):
+    """Return the EXIF orientation of an image opened from a file. Images
+    built in memory (for instance the post-processed captures) may keep the
+    EXIF data of the camera while their pixels are already oriented: 1 is
+    returned for them.
+
+    :param image: PIL image
+    :type image: :py:class:`PIL.Image`
+
+    :return: EXIF orientation value (1 to 8)
+    :rtype: int
+    """
+    if not getattr(image, 'filename', None):
+        return 1
+    return image.getexif().get(ORIENTATION_TAG, 1)
+
+
+def get_oriented_size(image):
+    """Return the size of the image once its EXIF orientation is applied
+    (see :py:func:`get_file_orientation`), without decoding it.
+
+    :param image: PIL image
+    :type image: :py:class:`PIL.Image`
+
+    :return: size (width, height)
+    :rtype: tuple
+    """
+    if get_file_orientation(image) in (5, 6, 7, 8):
+        return (image.size[1], image.size[0])
+    return image.size
+
+
+def open_image(fp, size=None):
+    """Open an image file. If a size is given, JPEG images are decoded
+    directly at a reduced scale (see :py:func:`draft_image`).
+
+    :param fp: filename or file object
+    :type fp: str
+    :param size: minimal size (width, height) to cover
+    :type size: tuple
+
+    :return: image not yet loaded
+    :rtype: :py:class:`PIL.Image`
+    """
+    return draft_image(Image.open(fp), size)
+
+
+def build_mipmaps(image, size, levels=2):
+    """Return reduced versions of the image to display it quickly: the first
+    one fits in the given size, each next one is half the previous one.
+
+    :param image: PIL image
+    :type image: :py:class:`PIL.Image`
+    :param size: size (width, height) of the first level
+    :type size: tuple
+    :param levels: number of levels
+    :type levels: int
+
+    :return: list of PIL images from the biggest to the smallest
+    :rtype: list
+    """
+    mipmaps = []
+    for _ in range(levels):
+        new_size = sizing.new_size_keep_aspect_ratio(image.size, size)
+        if new_size[0] >= image.size[0] or min(new_size) < 1:
+            break
+        image = image.resize(new_size, Resampling.LANCZOS, reducing_gap=3.0)
+        mipmaps.append(image)
+        size = (size[0] // 2, size[1] // 2)
+    return mipmaps
+
+
 def colorize_pil_image(pil_image, color, bg_color=None):
     """Convert a picto in white to the corresponding color.
 
@@ -145,22 +239,49 @@ def get_best_orientation(captures):
     :return: orientation PORTRAIT or LANDSCAPE
     :rtype: str
     """
-    is_portrait = captures[0].size[0] < captures[0].size[1]
-    if len(captures) == 1 or len(captures) == 4:
+    return get_size_orientation(get_oriented_size(captures[0]), len(captures))
+
+
+def get_size_orientation(size, count):
+    """Return the most adapted orientation (PORTRAIT or LANDSCAPE) to
+    concatenate the given number of captures of the given size.
+
+    :param size: size (width, height) of the captures
+    :type size: tuple
+    :param count: number of captures to concatenate
+    :type count: int
+
+    :return: orientation PORTRAIT or LANDSCAPE
+    :rtype: str
+    """
+    is_portrait = size[0] < size[1]
+    if count == 1 or count == 4:
         if is_portrait:
             orientation = PORTRAIT
         else:
             orientation = LANDSCAPE
-    elif len(captures) == 2 or len(captures) == 3:
+    elif count == 2 or count == 3:
         if is_portrait:
             orientation = LANDSCAPE
         else:
             orientation = PORTRAIT
     else:
-        raise ValueError("List of max 4 pictures expected, got {}".format(len(captures)))
+        raise ValueError("List of max 4 pictures expected, got {}".format(count))
     return orientation
 
 
+def scale_margins(factory, dpi):
+    """Scale the margins of the picture factory, defined in pixels at
+    :py:data:`REFERENCE_DPI`, to the given resolution.
+
+    :param factory: picture factory
+    :type factory: :py:class:`pibooth.pictures.factory.PictureFactory`
+    :param dpi: dot-per-inche resolution of the factory
+    :type dpi: int
+    """
+    factory.set_margin(factory._margin * dpi // REFERENCE_DPI, factory._margin_text * dpi // REFERENCE_DPI)
+
+
 def get_picture_factory(captures, orientation=AUTO, paper_format=(4, 6), force_pil=False, dpi=600):
     """Return the picture factory use to concatenate the captures.
 
@@ -183,7 +304,7 @@ def get_picture_factory(captures, orientation=AUTO, paper_format=(4, 6), force_p
     if paper_format[0] > paper_format[1]:
         paper_format = (paper_format[1], paper_format[0])
 
-    size = (paper_format[0] * dpi, paper_format[1] * dpi)
+    size = (int(paper_format[0] * dpi), int(paper_format[1] * dpi))
     if orientation == LANDSCAPE:
         size = (size[1], size[0])
 
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""Process-wide cache of decoded and resized images.
+"""
+
+import threading
+import os.path as osp
+from collections import OrderedDict
+import psutil
+from pibooth.utils import LOGGER
+
+
+# Bytes per pixel used by PIL to store images (3 bands are stored on 4 bytes)
+PIL_PIXEL_SIZES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+
+# Bytes per pixel of the images of a layout kept in cache: the resized
+# background, then the background with the texts or the overlay. It is the
+# same for both backends (PIL: 4 + 4, OpenCV: 3 + 5 for an alpha overlay).
+LAYOUT_PIXEL_SIZE = 8
+
+# Part of the available memory shared by the images caches of all the
+# processes generating pictures (main process and pool workers)
+MEMORY_SHARE = 0.25
+
+
+def get_nbytes(image):
+    """Return the memory size used by the pixels of the given image.
+
+    :param image: PIL image or numpy array
+    :type image: object
+
+    :return: size in bytes
+    :rtype: int
+    """
+    if hasattr(image, 'nbytes'):  # numpy array or alpha overlay
+        return image.nbytes
+    return image.size[0] * image.size[1] * PIL_PIXEL_SIZES.get(image.mode, 4)
+
+
+def get_budget(width, height, layouts=2):
+    """Return the memory needed to keep in cache the images of the layouts
+    of a picture of the given size.
+
+    :param width: picture width
+    :type width: int
+    :param height: picture height
+    :type height: int
+    :param layouts: number of layouts (one per number of captures)
+    :type layouts: int
+
+    :return: size in bytes
+    :rtype: int
+    """
+    return width * height * LAYOUT_PIXEL_SIZE * layouts
+
+
+def get_memory_budget(nbytes, processes=1, share=MEMORY_SHARE):
+    """Return the given budget limited to the part of the available memory
+    allowed to each process.
+
+    :param nbytes: needed size in bytes
+    :type nbytes: int
+    :param processes: number of processes having their own cache
+    :type processes: int
+    :param share: part of the available memory used by all processes
+    :type share: float
+
+    :return: size in bytes
+    :rtype: int
+    """
+    return min(nbytes, int(psutil.virtual_memory().available * share) // processes)
+
+
+class ImagesCache(object):
+
+    """Cache of decoded and resized images (background, overlay, compiled
+    layout background, ...) with a memory budget. The least recently used images are dropped when the
+    budget is exceeded.
+
+    The images are identified by their source file (path and modification
+    time), the target size, the cropping and the backend used to load them.
+    The returned images are shared: they shall not be modified.
+
+    :param max_bytes: memory budget in bytes
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def _evict(self):
+        """Drop the least recently used images until budget is respected.
+        """
+        while self.nbytes > self.max_bytes and self._images:
+            key, (_, nbytes) = self._images.popitem(last=False)
+            self.nbytes -= nbytes
+            LOGGER.debug("Drop from images cache %s", key[:3])
+
+    def set_max_bytes(self, max_bytes):
+        """Change the memory budget.
+
+        :param max_bytes: memory budget in bytes
+        :type max_bytes: int
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, path, size, crop, backend, loader):
+        """Return the image corresponding to the given parameters. If not in
+        the cache, the image is created by calling the ``loader`` function
+        without argument.
+
+        :param path: path to the source image file
+        :type path: str
+        :param size: target size (width, height)
+        :type size: tuple
+        :param crop: image is cropped to fit the target size
+        :type crop: bool
+        :param backend: name of the library used to load the image
+        :type backend: str
+        :param loader: function loading and resizing the image
+        :type loader: callable
+
+        :return: image object which depends on the loader
+        :rtype: object
+        """
+        key = (osp.abspath(path), osp.getmtime(path), tuple(size), crop, backend)
+        return self.get_item(key, loader)
+
+    def get_item(self, key, loader):
+        """Return the image corresponding to the given key. If not in the
+        cache, the image is created by calling the ``loader`` function
+        without argument.
+
+        :param key: hashable key identifying the image
+        :type key: tuple
+        :param loader: function creating the image
+        :type loader: callable
+
+        :return: image object which depends on the loader
+        :rtype: object
+        """
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key][0]
+
+        image = loader()
+        nbytes = get_nbytes(image)
+        if nbytes <= self.max_bytes:
+            with self._lock:
+                LOGGER.debug("Add to images cache %s (%s bytes)", key[:3], nbytes)
+                if key not in self._images:
+                    self._images[key] = (image, nbytes)
+                    self.nbytes += nbytes
+                    self._evict()
+        return image
+
+    def clear(self):
+        """Drop all cached images.
+        """
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+
+# Budget fits the two layouts of a 4x6 inches picture at 600 dpi if enough
+# memory is available (changed at startup depending on the printer
+# resolution, the number of pool workers or the configuration)
+CACHE = ImagesCache(get_memory_budget(get_budget(2400, 3600)))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Manipulation of the EXIF orientation of encoded JPEG images.
+"""
+
+import struct
+from PIL import Image
+
+ORIENTATION_TAG = 0x0112
+
+# EXIF orientation equivalent to a rotation (same direction than
+# PIL.Image.ROTATE_*) followed by an horizontal flip
+ORIENTATIONS = {(0, False): 1,
+                (90, False): 8,
+                (180, False): 3,
+                (270, False): 6,
+                (0, True): 2,
+                (90, True): 7,
+                (180, True): 4,
+                (270, True): 5}
+
+
+def get_orientation(rotation, flip=False):
+    """Return the EXIF orientation value which makes a viewer display the
+    image rotated by the given angle then flipped horizontally.
+
+    :param rotation: rotation angle (0, 90, 180 or 270)
+    :type rotation: int
+    :param flip: horizontal flip
+    :type flip: bool
+
+    :return: EXIF orientation value
+    :rtype: int
+    """
+    return ORIENTATIONS[(rotation, bool(flip))]
+
+
+def _iter_segments(data):
+    """Yield (marker, start, end) of JPEG segments preceding image data.
+    Start and end are the indexes of the segment payload.
+    """
+    if data[:2] != b'\xff\xd8':
+        raise ValueError("Not a JPEG image")
+    index = 2
+    while index + 4 <= len(data) and data[index] == 0xff:
+        marker = data[index + 1]
+        if marker == 0xda:  # Start of scan
+            return
+        length = struct.unpack('>H', data[index + 2:index + 4])[0]
+        yield marker, index + 4, index + 2 + length
+        index += 2 + length
+
+
+def _set_tiff_orientation(tiff, orientation):
+    """Set the orientation tag of the first IFD of the TIFF structure.
+    Return False if the tag is not defined.
+    """
+    order = '<' if tiff[:2] == b'II' else '>'
+    ifd = struct.unpack(order + 'I', tiff[4:8])[0]
+    count = struct.unpack(order + 'H', tiff[ifd:ifd + 2])[0]
+    for i in range(count):
+        entry = ifd + 2 + i * 12
+        tag, typ = struct.unpack(order + 'HH', tiff[entry:entry + 4])
+        if tag == ORIENTATION_TAG and typ == 3:
+            tiff[entry + 8:entry + 10] = struct.pack(order + 'H', orientation)
+            return True
+    return False
+
+
+def set_jpeg_orientation(data, orientation):
+    """Return a copy of the JPEG data with the given EXIF orientation. The
+    image data are not modified (no decoding/encoding).
+
+    :param data: JPEG encoded image
+    :type data: bytes
+    :param orientation: EXIF orientation value (1 to 8)
+    :type orientation: int
+
+    :return: new JPEG data or None if the orientation can not be set without
+             rewriting the existing EXIF data
+    :rtype: bytes
+    """
+    insert_at = 2
+    for marker, start, end in _iter_segments(data):
+        if marker == 0xe1 and data[start:start + 6] == b'Exif\x00\x00':
+            tiff = bytearray(data[start + 6:end])
+            try:
+                if not _set_tiff_orientation(tiff, orientation):
+                    return data if orientation == 1 else None
+            except struct.error:
+                return None  # Corrupted EXIF
+            return data[:start + 6] + bytes(tiff) + data[end:]
+        elif marker == 0xe0:  # JFIF segment shall be the first one
+            insert_at = end
+
+    if orientation == 1:
+        return data
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    payload = exif.tobytes()
+    return data[:insert_at] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + data[insert_at:]
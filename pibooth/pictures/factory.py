@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
 import os.path as osp
+from collections import OrderedDict
 from pibooth import fonts
+from pibooth import pictures
 from pibooth.utils import LOGGER
 from pibooth.pictures import sizing
-from PIL import Image, ImageDraw
+from pibooth.pictures.cache import CACHE
+from pibooth.pictures.output import save_image
+from PIL import Image, ImageDraw, ImageOps
 from PIL.Image import Resampling
 
 try:
@@ -15,6 +20,128 @@ except ImportError:
     cv2 = None
 
 
+# Number of compiled layouts kept in memory (one per captures number
+# is enough for a standard session)
+TEMPLATES_CACHE_SIZE = 2
+
+# Size of the square tiles used to classify overlay transparency
+OVERLAY_TILE_SIZE = 128
+
+_TEMPLATES = OrderedDict()
+_TEMPLATES_LOCK = threading.Lock()
+
+
+class LayoutTemplate(object):
+
+    """Static part of a picture layout: everything which doesn't depend on
+    the captures content. It is compiled once and shared by all factories
+    having the same parameters (see :py:meth:`PictureFactory._get_template_key`).
+
+    The template doesn't hold any image: the background (with the texts
+    drawn on it if possible) and the overlay are kept in the images cache
+    in order to respect its memory budget.
+
+    :attr key: key identifying the layout
+    :type key: tuple
+    :attr images_rects: list of (x, y, width, height) of each capture cell
+    :type images_rects: list
+    :attr texts: list of ((x, y), text, color, font) to draw on the final image
+    :type texts: list
+    :attr background_texts: list of ((x, y), text, color, font) to draw on
+                            the background (texts not covered by an overlay)
+    :type background_texts: list
+    """
+
+    def __init__(self, key, images_rects, texts=None, background_texts=None):
+        self.key = key
+        self.images_rects = images_rects
+        self.texts = texts or []
+        self.background_texts = background_texts or []
+
+
+class AlphaOverlay(object):
+
+    """RGBA overlay prepared for integer alpha compositing on numpy images.
+
+    The overlay is split in horizontal bands of square tiles. Consecutive
+    tiles having the same kind are merged in regions:
+
+    - fully transparent tiles are skipped,
+    - fully opaque tiles are copied,
+    - others are blended using uint16 arithmetic.
+
+    :param overlay: RGBA numpy array
+    :type overlay: :py:class:`numpy.ndarray`
+    :param tile_size: size of the tiles
+    :type tile_size: int
+    """
+
+    TRANSPARENT, OPAQUE, BLEND = 0, 1, 2
+
+    def __init__(self, overlay, tile_size=OVERLAY_TILE_SIZE):
+        self.shape = overlay.shape[:2]
+        self.rgb = np.ascontiguousarray(overlay[..., :3])
+        self.alpha = np.ascontiguousarray(overlay[..., 3:])
+        self.inv_alpha = 255 - self.alpha
+        self.regions = []  # List of (kind, y1, y2, x1, x2)
+        self.tile_size = tile_size
+
+        height, width = self.shape
+        for y1 in range(0, height, tile_size):
+            y2 = min(y1 + tile_size, height)
+            previous = None
+            for x1 in range(0, width, tile_size):
+                x2 = min(x1 + tile_size, width)
+                tile = self.alpha[y1:y2, x1:x2]
+                if tile.max() == 0:
+                    kind = self.TRANSPARENT
+                elif tile.min() == 255:
+                    kind = self.OPAQUE
+                else:
+                    kind = self.BLEND
+                if previous and previous[0] == kind:
+                    previous[4] = x2
+                else:
+                    previous = [kind, y1, y2, x1, x2]
+                    self.regions.append(previous)
+        self.regions = [tuple(region) for region in self.regions if region[0] != self.TRANSPARENT]
+
+    @property
+    def nbytes(self):
+        """Memory size used by the overlay data.
+        """
+        return self.rgb.nbytes + self.alpha.nbytes + self.inv_alpha.nbytes
+
+    def compose(self, image):
+        """Draw the overlay on the given RGB image (in place).
+
+        :param image: RGB numpy array of uint8
+        :type image: :py:class:`numpy.ndarray`
+        """
+        height = min(self.shape[0], image.shape[0])
+        width = min(self.shape[1], image.shape[1])
+        buf1 = np.empty((self.tile_size, width, 3), np.uint16)
+        buf2 = np.empty((self.tile_size, width, 3), np.uint16)
+
+        for kind, y1, y2, x1, x2 in self.regions:
+            y2, x2 = min(y2, height), min(x2, width)
+            if y1 >= y2 or x1 >= x2:
+                continue
+            if kind == self.OPAQUE:
+                image[y1:y2, x1:x2] = self.rgb[y1:y2, x1:x2]
+                continue
+            dst = image[y1:y2, x1:x2]
+            out1 = buf1[:y2 - y1, :x2 - x1]
+            out2 = buf2[:y2 - y1, :x2 - x1]
+            # dst = (dst * (255 - alpha) + rgb * alpha + 127) // 255
+            np.multiply(dst, self.inv_alpha[y1:y2, x1:x2], out=out1, dtype=np.uint16)
+            np.multiply(self.rgb[y1:y2, x1:x2], self.alpha[y1:y2, x1:x2], out=out2, dtype=np.uint16)
+            out1 += out2
+            out1 += 127
+            out1 //= 255
+            dst[...] = out1
+
+
 class PictureFactory(object):
 
     """
@@ -49,10 +176,13 @@ class PictureFactory(object):
         self._texts = []
         self._texts_height = 0
         self._final = None
+        self._canvas = None
+        self._template = None
         self._margin = 100
         self._margin_text = self._margin
         self._crop = False
         self._outlines = False
+        self._memory_limit = 0
         self._images = images
         self._overlay_image = None
         self._background_color = (255, 255, 255)
@@ -63,10 +193,22 @@ class PictureFactory(object):
         self.height = height
         self.is_portrait = self.width < self.height
 
+    def _get_image(self, image):
+        """Return the source PIL image converted for the child class implementation.
+
+        :param image: PIL image
+        :type image: object
+
+        :return: image object which depends on the child class implementation.
+        :rtype: object
+        """
+        raise NotImplementedError
+
     def _iter_images(self):
         """Yield source images to concatenate.
         """
-        raise NotImplementedError
+        for index, image in enumerate(self._images):
+            yield self._get_image(self._draft_image(index, image))
 
     def _iter_images_rects(self):
         """Yield top-left coordinates and max size rectangle for each source image.
@@ -170,6 +312,14 @@ class PictureFactory(object):
         """
         raise NotImplementedError
 
+    def _image_draw_texts(self, image, texts):
+        """Draw the given texts on the image.
+
+        :return: image object
+        :rtype: object
+        """
+        raise NotImplementedError
+
     def _build_background(self):
         """Create an image with the given background.
 
@@ -178,6 +328,68 @@ class PictureFactory(object):
         """
         raise NotImplementedError
 
+    def _draft_image(self, index, image):
+        """Return the source image of the given index to concatenate. A not
+        yet loaded JPEG file is opened again to be decoded at the scale
+        needed to fill its rectangle: the given image is not modified (it
+        may be used by other factories with bigger rectangles). The EXIF
+        orientation of image files is applied after decoding.
+        """
+        orientation = pictures.get_file_orientation(image)
+        if image.format == 'JPEG' and image.tile and getattr(image, 'filename', None):
+            _, _, max_w, max_h = self._get_template().images_rects[index]
+            if orientation in (5, 6, 7, 8):
+                max_w, max_h = max_h, max_w  # Rectangle in the orientation of the raw image
+            if not self._crop:
+                max_w, max_h = sizing.new_size_keep_aspect_ratio(image.size, (max_w, max_h))
+            image = pictures.open_image(image.filename, (max_w, max_h))
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+        return image
+
+    def _build_capture(self, image, index, src_image):
+        """Draw the source image in its rectangle on the given image.
+
+        :param image: image object which depends on the child class implementation.
+        :type image: object
+        :param index: index of the source image
+        :type index: int
+        :param src_image: source image object which depends on the child class implementation.
+        :type src_image: object
+        """
+        _, _, max_w, max_h = self._get_template().images_rects[index]
+        src_image, width, height = self._image_resize_keep_ratio(src_image, max_w, max_h, self._crop)
+        pos_x, pos_y = self._get_capture_position(index, width, height)
+        self._image_paste(src_image, image, pos_x, pos_y)
+
+    def _get_capture_position(self, index, width, height):
+        """Return the top-left position of the resized source image of the
+        given index in its rectangle.
+        """
+        pos_x, pos_y, max_w, max_h = self._get_template().images_rects[index]
+        # Adjust position to have identical margin between borders and images
+        if len(self._images) < 4:
+            pos_x, pos_y = pos_x + (max_w - width) // 2, pos_y + (max_h - height) // 2
+        elif index == 0:
+            pos_x, pos_y = pos_x + (max_w - width) * 2 // 3, pos_y + (max_h - height) * 2 // 3
+        elif index == 1:
+            pos_x, pos_y = pos_x + (max_w - width) // 3, pos_y + (max_h - height) * 2 // 3
+        elif index == 2:
+            pos_x, pos_y = pos_x + (max_w - width) * 2 // 3, pos_y + (max_h - height) // 3
+        else:
+            pos_x, pos_y = pos_x + (max_w - width) // 3, pos_y + (max_h - height) // 3
+        return pos_x, pos_y
+
+    def _iter_bands(self, width, height, bytes_per_pixel):
+        """Yield (top, bottom) of the horizontal bands of an image of the given
+        size, so that temporary images of each band respect the memory limit.
+        """
+        step = height
+        if self._memory_limit:
+            step = max(1, self._memory_limit // (width * bytes_per_pixel))
+        for top in range(0, height, step):
+            yield top, min(top + step, height)
+
     def _build_matrix(self, image):
         """Draw the images matrix on the given image.
 
@@ -187,25 +399,8 @@ class PictureFactory(object):
         :return: image object which depends on the child class implementation.
         :rtype: object
         """
-        offset_generator = self._iter_images_rects()
-        count = 1
-        for src_image in self._iter_images():
-            pos_x, pos_y, max_w, max_h = next(offset_generator)
-            src_image, width, height = self._image_resize_keep_ratio(src_image, max_w, max_h, self._crop)
-            # Adjust position to have identical margin between borders and images
-            if len(self._images) < 4:
-                pos_x, pos_y = pos_x + (max_w - width) // 2, pos_y + (max_h - height) // 2
-            elif count == 1:
-                pos_x, pos_y = pos_x + (max_w - width) * 2 // 3, pos_y + (max_h - height) * 2 // 3
-            elif count == 2:
-                pos_x, pos_y = pos_x + (max_w - width) // 3, pos_y + (max_h - height) * 2 // 3
-            elif count == 3:
-                pos_x, pos_y = pos_x + (max_w - width) * 2 // 3, pos_y + (max_h - height) // 3
-            else:
-                pos_x, pos_y = pos_x + (max_w - width) // 3, pos_y + (max_h - height) // 3
-
-            self._image_paste(src_image, image, pos_x, pos_y)
-            count += 1
+        for index, src_image in enumerate(self._iter_images()):
+            self._build_capture(image, index, src_image)
         return image
 
     def _build_final_image(self, image):
@@ -226,8 +421,24 @@ class PictureFactory(object):
         :param image: PIL.Image instance
         :type image: object
         """
+        self._draw_texts(image, self._get_template().texts)
+
+    def _build_overlay(self):
+        """Create the overlay image resized to the final picture size.
+
+        :return: image object which depends on the child class implementation.
+        :rtype: object
+        """
+        raise NotImplementedError
+
+    def _iter_texts(self):
+        """Yield the drawing parameters for each text. The fonts are fitted
+        to the texts rectangles.
+
+        :return: ((text_x, text_y), text, color, font)
+        :rtype: tuple
+        """
         offset_generator = self._iter_texts_rects()
-        draw = ImageDraw.Draw(image)
         for text, font_name, color, align in self._texts:
             text_x, text_y, max_width, max_height = next(offset_generator)
             if not text:  # Empty string: go to next text position
@@ -243,9 +454,93 @@ class PictureFactory(object):
             elif align == self.RIGHT:
                 text_x += (max_width - text_width)
 
-            draw.text((text_x - offset_x // 2,
-                       text_y + (max_height - text_height) // 2 - offset_y // 2),
-                      text, color, font=font)
+            yield ((text_x - offset_x // 2, text_y + (max_height - text_height) // 2 - offset_y // 2),
+                   text, color, font)
+
+    def _draw_texts(self, image, texts):
+        """Draw the given texts on a PIL image.
+
+        :param image: PIL.Image instance
+        :type image: object
+        :param texts: list of ((x, y), text, color, font)
+        :type texts: list
+        """
+        if texts:
+            draw = ImageDraw.Draw(image)
+            for position, text, color, font in texts:
+                draw.text(position, text, color, font=font)
+
+    def _get_template_key(self):
+        """Return a key identifying the static part of the layout.
+
+        :return: hashable key
+        :rtype: tuple
+        """
+        files = []
+        for path in (self._background_image, self._overlay_image):
+            if path:
+                files.append((path, osp.getmtime(path)))
+            else:
+                files.append(None)
+        return (self.name, self.width, self.height, len(self._images), self._margin,
+                self._margin_text, self._crop, tuple(self._background_color), tuple(files),
+                tuple((text, font, tuple(color), align) for text, font, color, align in self._texts))
+
+    def _compile_template(self, key):
+        """Compute all static elements of the layout.
+
+        :param key: key identifying the layout
+        :type key: tuple
+
+        :return: template instance
+        :rtype: :py:class:`LayoutTemplate`
+        """
+        LOGGER.info("Use %s to compile the layout", self.name)
+        images_rects = list(self._iter_images_rects())
+        texts = list(self._iter_texts())
+        if self._overlay_image:
+            return LayoutTemplate(key, images_rects, texts)
+        # Texts area doesn't overlap captures: draw them once for all
+        return LayoutTemplate(key, images_rects, background_texts=texts)
+
+    def _get_template(self):
+        """Return the compiled layout corresponding to the current parameters
+        (it is compiled if not found in the cache). The layout is searched
+        only once per build.
+
+        :return: template instance
+        :rtype: :py:class:`LayoutTemplate`
+        """
+        if self._template is None:
+            key = self._get_template_key()
+            with _TEMPLATES_LOCK:
+                if key in _TEMPLATES:
+                    _TEMPLATES.move_to_end(key)
+                else:
+                    _TEMPLATES[key] = self._compile_template(key)
+                    while len(_TEMPLATES) > TEMPLATES_CACHE_SIZE:
+                        _TEMPLATES.popitem(last=False)
+                self._template = _TEMPLATES[key]
+        return self._template
+
+    def _get_background(self):
+        """Return a new image with the background of the layout (and the
+        texts which can be drawn on it).
+
+        :return: image object which depends on the child class implementation.
+        :rtype: object
+        """
+        template = self._get_template()
+        if not template.background_texts:
+            return self._build_background()
+        if self._memory_limit:  # Don't keep a full size image in cache
+            return self._image_draw_texts(self._build_background(), template.background_texts)
+        return CACHE.get_item(('layout',) + template.key, self._compile_background).copy()
+
+    def _compile_background(self):
+        """Create the background with the texts drawn on it.
+        """
+        return self._image_draw_texts(self._build_background(), self._get_template().background_texts)
 
     def _build_outlines(self, image):
         """Build rectangle around each elements. This method is only for
@@ -280,6 +575,7 @@ class PictureFactory(object):
         else:
             self._texts_height = int(self.height // 8)
         self._final = None  # Force rebuild
+        self._template = None
 
     def set_background(self, color_or_path):
         """Set background color (RGB tuple) or path to an image that used to
@@ -296,6 +592,7 @@ class PictureFactory(object):
                 raise ValueError("Invalid background image '{}'".format(color_or_path))
             self._background_image = color_or_path
         self._final = None  # Force rebuild
+        self._template = None
 
     def set_overlay(self, image_path):
         """Set an image that will be paste over the final picture.
@@ -307,6 +604,7 @@ class PictureFactory(object):
             raise ValueError("Invalid background image '{}'".format(image_path))
         self._overlay_image = image_path
         self._final = None  # Force rebuild
+        self._template = None
 
     def set_margin(self, margin, margin_text=None):
         """Set margin between concatenated images.
@@ -322,6 +620,7 @@ class PictureFactory(object):
         else:
             self._margin_text = margin_text
         self._final = None  # Force rebuild
+        self._template = None
 
     def set_cropping(self, crop=True):
         """Enable the cropping of source images it order to fit to the final
@@ -332,6 +631,7 @@ class PictureFactory(object):
         """
         self._crop = crop
         self._final = None  # Force rebuild
+        self._template = None
 
     def set_outlines(self, outlines=True):
         """Draw outlines for each rectangle available for drawing
@@ -342,6 +642,78 @@ class PictureFactory(object):
         """
         self._outlines = outlines
         self._final = None  # Force rebuild
+        self._template = None
+
+    def set_memory_limit(self, nbytes=0):
+        """Set the maximum memory used by each temporary image created to
+        build the final image. Bigger images are processed by horizontal
+        bands (if supported by the implementation). The background and the
+        overlay are then resized from their files and not kept in cache.
+
+        :param nbytes: memory limit in bytes (0 for no limit)
+        :type nbytes: int
+        """
+        self._memory_limit = nbytes
+        self._final = None  # Force rebuild
+        self._template = None
+
+    def _build_final(self, image):
+        """Assemble the final image from the given one (background and matrix
+        already drawn).
+        """
+        LOGGER.info("Use %s to assemble final image", self.name)
+        self._final = self._build_final_image(image)
+
+        LOGGER.info("Use %s to draw texts", self.name)
+        self._build_texts(self._final)
+
+        if self._outlines:
+            LOGGER.info("Use %s to outline boundary borders", self.name)
+            self._build_outlines(self._final)
+
+        return self._final
+
+    def begin(self, count):
+        """Start a progressive build: the final image is composed while the
+        captures are added one by one with :py:meth:`add_capture`, then
+        completed by :py:meth:`finalize`.
+
+        :param count: number of captures to concatenate
+        :type count: int
+        """
+        assert count in range(1, 5), "1 to 4 images can be concatenated"
+        self._images = [None] * count
+        self._final = None
+        self._template = None
+        LOGGER.info("Use %s to create background", self.name)
+        self._canvas = self._get_background()
+
+    def add_capture(self, index, image):
+        """Draw the capture of the given index (see :py:meth:`begin`).
+
+        :param index: index of the capture
+        :type index: int
+        :param image: PIL image
+        :type image: object
+        """
+        if self._canvas is None:
+            raise ValueError("Progressive build not started")
+        self._images[index] = image
+        LOGGER.info("Use %s to draw capture %s", self.name, index + 1)
+        self._build_capture(self._canvas, index, self._get_image(self._draft_image(index, image)))
+
+    def finalize(self):
+        """Complete the progressive build (see :py:meth:`begin`).
+
+        :return: PIL.Image instance
+        :rtype: object
+        """
+        if self._canvas is None:
+            raise ValueError("Progressive build not started")
+        if any(image is None for image in self._images):
+            raise ValueError("{} capture(s) not added".format(self._images.count(None)))
+        image, self._canvas = self._canvas, None
+        return self._build_final(image)
 
     def build(self, rebuild=False):
         """Build the final image or doas nothing if the final image
@@ -353,41 +725,40 @@ class PictureFactory(object):
         :return: PIL.Image instance
         :rtype: object
         """
+        if self._canvas is not None:
+            return self.finalize()
+
         if not self._final or rebuild:
+            self._template = None  # Search it again (files may have changed)
 
             LOGGER.info("Use %s to create background", self.name)
-            image = self._build_background()
+            image = self._get_background()
 
             LOGGER.info("Use %s to concatenate images", self.name)
             image = self._build_matrix(image)
 
-            LOGGER.info("Use %s to assemble final image", self.name)
-            self._final = self._build_final_image(image)
-
-            LOGGER.info("Use %s to draw texts", self.name)
-            self._build_texts(self._final)
-
-            if self._outlines:
-                LOGGER.info("Use %s to outline boundary borders", self.name)
-                self._build_outlines(self._final)
+            self._build_final(image)
 
         return self._final
 
-    def save(self, path):
-        """Build if not already done and save final image in a file.
+    def save(self, *paths, **options):
+        """Build if not already done and save final image in one or more
+        files. The image is encoded only once.
 
-        :param path: path to save
-        :type path: str
+        :param paths: paths to save
+        :type paths: str
+        :param options: encoder options (e.g. ``quality``)
+        :type options: dict
 
         :return: PIL.Image instance
         :rtype: object
         """
-        dirname = osp.dirname(osp.abspath(path))
-        if not osp.isdir(dirname):
-            os.mkdir(dirname)
+        for path in paths:
+            dirname = osp.dirname(osp.abspath(path))
+            if not osp.isdir(dirname):
+                os.makedirs(dirname)
         image = self.build()
-        LOGGER.info("Save image '%s'", path)
-        image.save(path)
+        save_image(image, *paths, **options)
         return image
 
 
@@ -410,32 +781,112 @@ class PilPictureFactory(PictureFactory):
         """
         dest_image.paste(image, (pos_x, pos_y))
 
-    def _iter_images(self):
+    def _resize_by_bands(self, src_image, max_w, max_h, crop, bytes_per_pixel):
+        """Return the size of the source image resized (and cropped if
+        requested) to fit the given size, and an iterator on the (top, band)
+        of the resized image. Only the source pixels needed for each band
+        are resampled, so that temporary images respect the memory limit.
+        """
+        if crop:
+            width, height = sizing.new_size_keep_aspect_ratio(src_image.size, (max_w, max_h), 'outer')
+            x1, y1, x2, y2 = sizing.new_size_by_croping((width, height), (max_w, max_h))
+        else:
+            width, height = sizing.new_size_keep_aspect_ratio(src_image.size, (max_w, max_h), 'inner')
+            x1, y1, x2, y2 = 0, 0, width, height
+        scale_x, scale_y = src_image.size[0] / width, src_image.size[1] / height
+
+        def iter_bands():
+            # Horizontal pass of the resampling creates an intermediate image
+            # with the height of the source box
+            for top, bottom in self._iter_bands(x2 - x1, y2 - y1, int(bytes_per_pixel * (1 + scale_y)) + 1):
+                box = (x1 * scale_x, (y1 + top) * scale_y, x2 * scale_x, (y1 + bottom) * scale_y)
+                yield top, src_image.resize((x2 - x1, bottom - top), Resampling.LANCZOS, box=box)
+
+        return (x2 - x1, y2 - y1), iter_bands()
+
+    def _build_capture(self, image, index, src_image):
+        """See upper class description. If a memory limit is set, the source
+        image is resized and pasted by bands.
+        """
+        if not self._memory_limit:
+            return super(PilPictureFactory, self)._build_capture(image, index, src_image)
+
+        _, _, max_w, max_h = self._get_template().images_rects[index]
+        (width, height), bands = self._resize_by_bands(src_image, max_w, max_h, self._crop,
+                                                       len(src_image.getbands()))
+        pos_x, pos_y = self._get_capture_position(index, width, height)
+        for top, band in bands:
+            image.paste(band, (pos_x, pos_y + top))
+
+    def _image_draw_texts(self, image, texts):
         """See upper class description.
         """
-        for image in self._images:
-            yield image
+        self._draw_texts(image, texts)
+        return image
 
-    def _build_final_image(self, image):
+    def _get_image(self, image):
         """See upper class description.
         """
-        if self._overlay_image:
-            overlay = Image.open(self._overlay_image).convert('RGBA')
-            overlay, _, _ = self._image_resize_keep_ratio(overlay, self.width, self.height, True)
-            image = Image.alpha_composite(image.convert('RGBA'), overlay)
+        return image
+
+    def _build_overlay(self):
+        """See upper class description.
+        """
+        return CACHE.get(self._overlay_image, (self.width, self.height), True, 'pil', self._load_overlay)
+
+    def _load_overlay(self):
+        """Load the overlay image from its file and resize it.
+        """
+        overlay = Image.open(self._overlay_image).convert('RGBA')
+        overlay, _, _ = self._image_resize_keep_ratio(overlay, self.width, self.height, True)
+        return overlay
+
+    def _build_final_image(self, image):
+        """See upper class description. If a memory limit is set, the overlay
+        is resized from its file and composited by bands (not cached).
+        """
+        if self._overlay_image and self._memory_limit:
+            overlay = Image.open(self._overlay_image)
+            if overlay.mode != 'RGBA':
+                overlay = overlay.convert('RGBA')
+            # Resampled RGBA band, RGBA band of the image, composited band and RGB band
+            _, bands = self._resize_by_bands(overlay, self.width, self.height, True, 4 + 4 + 4 + 3)
+            for top, band in bands:
+                box = (0, top, self.width, top + band.size[1])
+                band = Image.alpha_composite(image.crop(box).convert('RGBA'), band)
+                image.paste(band.convert('RGB'), box)
+        elif self._overlay_image:
+            image = Image.alpha_composite(image.convert('RGBA'), self._build_overlay())
             image = image.convert('RGB')
         return image
 
     def _build_background(self):
-        """See upper class description.
+        """See upper class description. If a memory limit is set, the
+        background is resized from its file by bands (not cached).
         """
-        if self._background_image:
-            bg = Image.open(self._background_image)
-            image, _, _ = self._image_resize_keep_ratio(bg, self.width, self.height, True)
+        if self._background_image and self._memory_limit:
+            image = Image.new('RGB', (self.width, self.height))
+            bg = pictures.open_image(self._background_image, (self.width, self.height))
+            if bg.mode != 'RGB':
+                bg = bg.convert('RGB')
+            _, bands = self._resize_by_bands(bg, self.width, self.height, True, 3)
+            for top, band in bands:
+                image.paste(band, (0, top))
+        elif self._background_image:
+            # Copy because the image may be modified (cached one is shared)
+            image = CACHE.get(self._background_image, (self.width, self.height), True, 'pil',
+                              self._load_background).copy()
         else:
             image = Image.new('RGB', (self.width, self.height), color=self._background_color)
         return image
 
+    def _load_background(self):
+        """Load the background image from its file and resize it.
+        """
+        bg = Image.open(self._background_image)
+        image, _, _ = self._image_resize_keep_ratio(bg, self.width, self.height, True)
+        return image
+
 
 class OpenCvPictureFactory(PictureFactory):
 
@@ -471,55 +922,54 @@ class OpenCvPictureFactory(PictureFactory):
         height, width = image.shape[:2]
         dest_image[pos_y:(pos_y + height), pos_x:(pos_x + width)] = image
 
-    def _iter_images(self):
+    def _image_draw_texts(self, image, texts):
         """See upper class description.
         """
-        for image in self._images:
-            yield np.array(image.convert('RGB'))
+        pil_image = Image.fromarray(image)
+        self._draw_texts(pil_image, texts)
+        return np.array(pil_image)
 
-    def _build_final_image(self, image):
+    def _get_image(self, image):
         """See upper class description.
         """
-        if self._overlay_image:
-            overlay = cv2.cvtColor(cv2.imread(self._overlay_image, cv2.IMREAD_UNCHANGED), cv2.COLOR_BGR2RGBA)
-            overlay, _, _ = self._image_resize_keep_ratio(overlay, self.width, self.height, True)
-
-            x, y = 0, 0
-            image_width = image.shape[1]
-            image_height = image.shape[0]
-
-            h, w = overlay.shape[0], overlay.shape[1]
-
-            if x + w > image_width:
-                w = image_width - x
-                overlay = overlay[:, :w]
-
-            if y + h > image_height:
-                h = image_height - y
-                overlay = overlay[:h]
-
-            if overlay.shape[2] < 4:
-                overlay = np.concatenate(
-                    [
-                        overlay,
-                        np.ones((overlay.shape[0], overlay.shape[1], 1), dtype=overlay.dtype) * 255
-                    ],
-                    axis=2,
-                )
+        return np.array(image.convert('RGB'))
 
-            overlay_image = overlay[..., :3]
-            mask = overlay[..., 3:] / 255.0
+    def _build_overlay(self):
+        """See upper class description.
+        """
+        return CACHE.get(self._overlay_image, (self.width, self.height), True, 'opencv', self._load_overlay)
 
-            image[y:y+h, x:x+w] = (1.0 - mask) * image[y:y+h, x:x+w] + mask * overlay_image
+    def _load_overlay(self):
+        """Load the overlay image from its file and resize it.
+        """
+        overlay = cv2.cvtColor(cv2.imread(self._overlay_image, cv2.IMREAD_UNCHANGED), cv2.COLOR_BGR2RGBA)
+        overlay, _, _ = self._image_resize_keep_ratio(overlay, self.width, self.height, True)
+
+        if overlay.shape[2] < 4:
+            overlay = np.concatenate(
+                [
+                    overlay,
+                    np.ones((overlay.shape[0], overlay.shape[1], 1), dtype=overlay.dtype) * 255
+                ],
+                axis=2,
+            )
+        return AlphaOverlay(overlay)
 
+    def _build_final_image(self, image):
+        """See upper class description.
+        """
+        overlay = self._build_overlay() if self._overlay_image else None
+        if overlay is not None:
+            overlay.compose(image)
         return Image.fromarray(image)
 
     def _build_background(self):
         """See upper class description.
         """
         if self._background_image:
-            bg = cv2.cvtColor(cv2.imread(self._background_image), cv2.COLOR_BGR2RGB)
-            image, _, _ = self._image_resize_keep_ratio(bg, self.width, self.height, True)
+            # Copy because the image may be modified (cached one is shared)
+            image = CACHE.get(self._background_image, (self.width, self.height), True, 'opencv',
+                              self._load_background).copy()
         else:
             # Small optimization for all white or all black (or all grey...) background
             if self._background_color[0] == self._background_color[1] and self._background_color[1] == self._background_color[2]:
@@ -529,3 +979,10 @@ class OpenCvPictureFactory(PictureFactory):
                 image[:] = (self._background_color[0], self._background_color[1], self._background_color[2])
 
         return image
+
+    def _load_background(self):
+        """Load the background image from its file and resize it.
+        """
+        bg = cv2.cvtColor(cv2.imread(self._background_image), cv2.COLOR_BGR2RGB)
+        image, _, _ = self._image_resize_keep_ratio(bg, self.width, self.height, True)
+        return image
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""Write images to several destinations with a single encoding.
+"""
+
+import io
+import os
+import os.path as osp
+from PIL import Image
+from pibooth.utils import LOGGER
+
+
+def get_format(path):
+    """Return the PIL format name corresponding to the file extension.
+
+    :param path: path to the image file
+    :type path: str
+
+    :return: format name (e.g. 'JPEG')
+    :rtype: str
+    """
+    ext = osp.splitext(path)[1].lower()
+    if ext not in Image.registered_extensions():
+        raise ValueError("Unknown image extension '{}'".format(ext))
+    return Image.registered_extensions()[ext]
+
+
+def encode_image(image, fmt='JPEG', **options):
+    """Encode a PIL image in memory.
+
+    :param image: PIL image to encode
+    :type image: :py:class:`PIL.Image`
+    :param fmt: PIL format name
+    :type fmt: str
+
+    :return: encoded data
+    :rtype: bytes
+    """
+    stream = io.BytesIO()
+    image.save(stream, format=fmt, **options)
+    return stream.getvalue()
+
+
+def _get_tmp_path(path):
+    """Return a temporary path in the same directory than the given one.
+    """
+    dirname, basename = osp.split(path)
+    return osp.join(dirname, '.{}.{}.tmp'.format(basename, os.getpid()))
+
+
+def write_bytes(data, *paths):
+    """Write data to all given paths. Each file is written atomically:
+    data are written in a temporary file which is then renamed. When
+    destinations are on the same filesystem, a hard link to the first
+    written file is created instead of writing the data again.
+
+    :param data: data to write
+    :type data: bytes
+    :param paths: destinations paths
+    :type paths: str
+    """
+    sources = {}  # Device id -> first path written on it (None if links not supported)
+    for path in paths:
+        path = osp.abspath(path)
+        tmp_path = _get_tmp_path(path)
+        device = os.stat(osp.dirname(path)).st_dev
+        source = sources.get(device)
+        try:
+            if source:
+                try:
+                    os.link(source, tmp_path)
+                except OSError as ex:
+                    LOGGER.debug("Can not create hard link for '%s' (%s)", path, ex)
+                    sources[device] = source = None
+            if not source:
+                with open(tmp_path, 'wb') as fp:
+                    fp.write(data)
+                sources.setdefault(device, path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def save_image(image, *paths, **options):
+    """Encode the image once and write it to all given paths. The format is
+    deduced from the extension of the first path.
+
+    :param image: PIL image to save
+    :type image: :py:class:`PIL.Image`
+    :param paths: destinations paths
+    :type paths: str
+    """
+    if not paths:
+        return
+    data = encode_image(image, get_format(paths[0]), **options)
+    for path in paths:
+        LOGGER.info("Save image '%s'", path)
+    write_bytes(data, *paths)
@@ -1,6 +1,116 @@
 # -*- coding: utf-8 -*-
 
+import copy
 import multiprocessing
+from multiprocessing import shared_memory
+from PIL import Image
+from pibooth.utils import LOGGER
+from pibooth.pictures.cache import CACHE
+
+# Modules imported once by the fork server, then inherited by all workers
+PRELOADED_MODULES = ['PIL.Image', 'pibooth.pictures.factory']
+
+# Modes of the images mapped by PIL.Image.frombuffer() without copy
+SHARED_MODES = ('L', 'P', 'RGBX', 'RGBA', 'CMYK')
+
+
+def _init_worker(cache_max_bytes):
+    """Initialize a worker process. The images cache of the process lives
+    as long as the worker, thus it is reused by all the factories built there.
+    """
+    CACHE.set_max_bytes(cache_max_bytes)
+
+
+class SharedImage(object):
+
+    """Handle to a PIL image stored in a shared memory block. Only the
+    descriptor (name, mode, size) is pickled when the handle is sent to a
+    worker process. Images are stored in a mode which can be mapped without
+    copy (for instance RGBX for RGB captures).
+
+    :param image: PIL image to share
+    :type image: :py:class:`PIL.Image`
+    """
+
+    def __init__(self, image):
+        if image.mode not in SHARED_MODES:
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGBX')
+        self.mode = image.mode
+        self.size = image.size
+        data = image.tobytes()
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self._shm.buf[:len(data)] = data
+        self.name = self._shm.name
+
+    def __getstate__(self):
+        return {'name': self.name, 'mode': self.mode, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def open(self):
+        """Return the PIL image mapped on the shared memory block (without
+        copy, the image is read-only).
+
+        :return: PIL image
+        :rtype: :py:class:`PIL.Image`
+        """
+        if not self._shm:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return Image.frombuffer(self.mode, self.size, self._shm.buf, 'raw', self.mode, 0, 1)
+
+    def close(self):
+        """Close access to the shared memory block from this process.
+        """
+        if self._shm:
+            try:
+                self._shm.close()
+            except BufferError:
+                pass  # Still used by an image, released with the process
+            self._shm = None
+
+    def unlink(self):
+        """Release the shared memory block (shall be called by its creator).
+        """
+        shm = self._shm or shared_memory.SharedMemory(name=self.name)
+        self.close()
+        shm.unlink()
+
+
+def get_processes(processes=0):
+    """Return the number of worker processes of the pool.
+
+    :param processes: configured number (0 for the number of CPUs limited to 4)
+    :type processes: int
+    """
+    return processes or min(multiprocessing.cpu_count(), 4)
+
+
+def _build(factory):
+    """Build the factory after mapping the shared images (executed by a
+    worker process).
+    """
+    handles = factory._images
+    try:
+        factory._images = [handle.open() for handle in handles]
+        return factory.build()
+    finally:
+        factory._images = []
+        for handle in handles:
+            handle.close()
+
+
+def _get_context():
+    """Return the multiprocessing context used to start the workers: new
+    workers are forked from a server process which has already imported
+    the heavy modules (if 'forkserver' is available on the platform).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(PRELOADED_MODULES)
+        return context
+    return multiprocessing.get_context()
 
 
 class PicturesFactoryPool(object):
@@ -8,25 +118,66 @@ class PicturesFactoryPool(object):
     def __init__(self):
         self._pool = None
         self._async_results = []
+        self._shared = {}  # id(image) -> (image, SharedImage)
+
+    def start(self, processes=0, maxtasksperchild=0):
+        """Start the worker processes (nothing is done if already started).
+
+        :param processes: number of workers (0 for the number of CPUs limited to 4)
+        :type processes: int
+        :param maxtasksperchild: number of tasks before replacing a worker by
+                                 a fresh one (0 to keep workers alive)
+        :type maxtasksperchild: int
+        """
+        if self._pool:
+            return
+        processes = get_processes(processes)
+        LOGGER.debug("Start pictures factory pool with %s process(es)", processes)
+        self._pool = _get_context().Pool(processes=processes,
+                                         initializer=_init_worker,
+                                         initargs=(CACHE.max_bytes,),
+                                         maxtasksperchild=maxtasksperchild or None)
+
+    def _share(self, image):
+        """Return the shared memory handle of the image (created only once
+        for all the factories using it).
+        """
+        if id(image) not in self._shared:
+            self._shared[id(image)] = (image, SharedImage(image))
+        return self._shared[id(image)][1]
 
     def add(self, factory):
-        """Add a new picture factory and build it asyncronously.
+        """Add a new picture factory and build it asyncronously. The source
+        images are sent to the workers through shared memory.
         """
-        if not self._pool:
-            self._pool = multiprocessing.Pool(processes=min(multiprocessing.cpu_count(), 4))
-        self._async_results.append(self._pool.apply_async(factory.build))
+        self.start()
+        factory = copy.copy(factory)
+        factory._images = [self._share(image) for image in factory._images]
+        self._async_results.append(self._pool.apply_async(_build, (factory,)))
 
     def get(self):
         """Return all the results.
         """
-        return [res.get() for res in self._async_results]
+        results = [res.get() for res in self._async_results]
+        self._release()  # Source images not needed anymore
+        return results
 
     def clear(self):
         """Cancel all run tasks and drop all factories.
         """
-        for res in self._async_results:
-            res.get(5)
-        self._async_results = []
+        try:
+            for res in self._async_results:
+                res.get(5)
+        finally:
+            self._async_results = []
+            self._release()
+
+    def _release(self):
+        """Release all shared memory blocks.
+        """
+        for _, handle in self._shared.values():
+            handle.unlink()
+        self._shared.clear()
 
     def quit(self):
         """Quit and cleanup the pool.
@@ -34,3 +185,6 @@ class PicturesFactoryPool(object):
         if self._pool:
             self._pool.terminate()
             self._pool.join()
+            self._pool = None
+        self._async_results = []
+        self._release()
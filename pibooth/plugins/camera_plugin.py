@@ -104,6 +104,8 @@ class CameraPlugin(object):
         else:
             app.camera.capture(effect)
 
+        # Post-process during the next preview (or while starting processing)
+        app.camera.post_process_async()
         self.count += 1
 
     @pibooth.hookimpl
@@ -55,6 +55,11 @@ def pibooth_setup_picture_factory(cfg, opt_index, factory):
     used instead of the default one. The returned object shall have the same
     public API than :py:class:`pibooth.pictures.factory.PictureFactory`.
 
+    This hook is called from the main thread. When the final picture is
+    composed while the captures are taken (progressive build), the factory
+    is set up before the first capture is available: its source images are
+    ``None`` placeholders, replaced by the captures in a background thread.
+
     :param cfg: application configuration
     :param opt_index: index for tuple options related to captures number
     :param factory: default ``PictureFactory`` instance (not configured yet)
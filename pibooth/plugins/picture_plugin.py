@@ -4,10 +4,17 @@ import os
 import os.path as osp
 import itertools
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import pibooth
 from pibooth.utils import LOGGER, PoolingTimer
-from pibooth.pictures import get_picture_factory
-from pibooth.pictures.pool import PicturesFactoryPool
+from pibooth.pictures import AUTO, get_picture_factory, get_size_orientation, build_mipmaps, scale_margins
+from pibooth.pictures.output import save_image, write_bytes
+from pibooth.pictures.cache import CACHE, get_budget, get_memory_budget
+from pibooth.pictures.pool import PicturesFactoryPool, get_processes
+
+
+# Resolution of the pictures of the animation
+ANIMATION_DPI = 200
 
 
 class PicturePlugin(object):
@@ -20,17 +27,26 @@ class PicturePlugin(object):
     def __init__(self, plugin_manager):
         self._pm = plugin_manager
         self.factory_pool = PicturesFactoryPool()
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self.processing = None  # Future of the current processing step
+        self.processing_step = None
+        self.captures = None
+        self.picture_file = None
+        self.progressive_factory = None  # Final picture composed during captures
+        self.progressive_jobs = []
         self.picture_destroy_timer = PoolingTimer(0)
         self.second_previous_picture = None
         self.texts_vars = {}
 
-    def _reset_vars(self, app):
+    def _reset_vars(self, app, win=None):
         """Destroy final picture (can not be used anymore).
         """
         self.factory_pool.clear()
         app.previous_picture = None
         app.previous_animated = None
         app.previous_picture_file = None
+        if win:
+            win.set_animation([])
 
     @pibooth.hookimpl(hookwrapper=True)
     def pibooth_setup_picture_factory(self, cfg, opt_index, factory):
@@ -59,88 +75,198 @@ class PicturePlugin(object):
         if cfg.getboolean('PICTURE', 'captures_cropping'):
             factory.set_cropping()
 
+        factory.set_memory_limit(cfg.getint('PICTURE', 'memory_limit') * 1024 * 1024)
+
         if cfg.getboolean('GENERAL', 'debug'):
             factory.set_outlines()
 
         outcome.force_result(factory)
 
+    @pibooth.hookimpl
+    def pibooth_startup(self, cfg, app):
+        cache_size = cfg.getint('PICTURE', 'cache_size') * 1024 * 1024
+        if not cache_size:
+            # Each worker of the pool has its own cache
+            paper_format, dpi = app.printer.get_profile()
+            cache_size = get_memory_budget(get_budget(int(paper_format[0] * dpi), int(paper_format[1] * dpi)),
+                                           1 + get_processes(cfg.getint('PICTURE', 'pool_size')))
+        CACHE.set_max_bytes(cache_size)
+
+        # Start workers now to avoid delaying the first pictures generation
+        self.factory_pool.start(cfg.getint('PICTURE', 'pool_size'),
+                                cfg.getint('PICTURE', 'pool_max_tasks'))
+
     @pibooth.hookimpl
     def pibooth_cleanup(self):
         self.factory_pool.quit()
+        self._worker.shutdown()
 
     @pibooth.hookimpl
-    def state_failsafe_enter(self, app):
-        self._reset_vars(app)
+    def state_failsafe_enter(self, app, win):
+        self._reset_vars(app, win)
+        self.progressive_factory = None
+        self.progressive_jobs = []
 
     @pibooth.hookimpl
-    def state_wait_enter(self, cfg, app):
+    def state_wait_enter(self, cfg, app, win):
+        self.progressive_factory = None
+        self.progressive_jobs = []
         animated = self.factory_pool.get()
         if cfg.getfloat('WINDOW', 'wait_picture_delay') == 0:
             # Do it here to avoid a transient display of the picture
-            self._reset_vars(app)
+            self._reset_vars(app, win)
         elif animated:
             app.previous_animated = itertools.cycle(animated)
+            win.set_animation(animated)
 
         # Reset timeout in case of settings changed
         self.picture_destroy_timer.timeout = max(0, cfg.getfloat('WINDOW', 'wait_picture_delay'))
         self.picture_destroy_timer.start()
 
     @pibooth.hookimpl
-    def state_wait_do(self, cfg, app):
+    def state_wait_do(self, cfg, app, win):
         if cfg.getfloat('WINDOW', 'wait_picture_delay') > 0 and self.picture_destroy_timer.is_timeout()\
                 and app.previous_picture_file:
-            self._reset_vars(app)
+            self._reset_vars(app, win)
 
-    @pibooth.hookimpl
-    def state_processing_enter(self, app):
-        self.second_previous_picture = app.previous_picture
-        self._reset_vars(app)
-
-    @pibooth.hookimpl
-    def state_processing_do(self, cfg, app):
+    def _setup_factory(self, cfg, app, captures, orientation=None):
+        """Return the picture factory configured by the plugins.
+        """
         idx = app.capture_choices.index(app.capture_nbr)
         self.texts_vars['date'] = datetime.strptime(app.capture_date, "%Y-%m-%d-%H-%M-%S")
         self.texts_vars['count'] = app.count
 
+        # Render at the resolution and in the printable area of the printer
+        paper_format, dpi = app.printer.get_profile()
+        default_factory = get_picture_factory(captures, orientation or cfg.get('PICTURE', 'orientation'),
+                                              paper_format, dpi=dpi)
+        factory = self._pm.hook.pibooth_setup_picture_factory(cfg=cfg,
+                                                              opt_index=idx,
+                                                              factory=default_factory)
+        scale_margins(factory, dpi)
+        return factory
+
+    def _add_capture(self, factory, camera, index):
+        """Draw a capture on the final picture as soon as it is post-processed,
+        the background is drawn before the first one (executed by the
+        processing worker).
+        """
+        if index == 0:
+            factory.begin(len(factory._images))
+        factory.add_capture(index, camera.get_capture(index))
+
+    @pibooth.hookimpl
+    def state_capture_exit(self, cfg, app):
+        index = len(self.progressive_jobs)
+        if index == 0:
+            orientation = cfg.get('PICTURE', 'orientation')
+            if orientation == AUTO:
+                # Captures are not available yet, choose the layout from the camera resolution
+                orientation = get_size_orientation(app.camera.resolution, app.capture_nbr)
+            self.progressive_factory = self._setup_factory(cfg, app, [None] * app.capture_nbr, orientation)
+
+        self.progressive_jobs.append(self._worker.submit(self._add_capture, self.progressive_factory,
+                                                         app.camera, index))
+
+    @pibooth.hookimpl
+    def state_processing_enter(self, app, win):
+        self.second_previous_picture = app.previous_picture
+        self._reset_vars(app, win)
+        self.processing = None
+        self.processing_step = None
+
+    def _save_captures(self, cfg, app):
+        """Retrieve the captures from the camera and save them in the raw
+        directories (executed by the processing worker).
+        """
         LOGGER.info("Saving raw captures")
-        captures = app.camera.get_captures()
+        captures = app.camera.get_captures(raw=True)
 
+        rawdirs = []
         for savedir in cfg.gettuple('GENERAL', 'directory', 'path'):
-            rawdir = osp.join(savedir, "raw", app.capture_date)
-            os.makedirs(rawdir)
+            rawdirs.append(osp.join(savedir, "raw", app.capture_date))
+            os.makedirs(rawdirs[-1])
+
+        for count, (capture, data) in enumerate(captures):
+            paths = [osp.join(rawdir, "pibooth{:03}.jpg".format(count)) for rawdir in rawdirs]
+            if data:
+                write_bytes(data, *paths)  # Original data from the camera
+            else:
+                save_image(capture, *paths)
+        return [capture for capture, _ in captures]
+
+    def _save_picture(self, factory, paths, display_size=None):
+        """Build the final picture, save it and reduce it to the display size
+        (executed by the processing worker).
+        """
+        LOGGER.info("Creating the final picture")
+        image = factory.build()
+        factory.save(*paths)
+        mipmaps = build_mipmaps(image, display_size) if display_size else []
+        return image, mipmaps
 
-            for capture in captures:
-                count = captures.index(capture)
-                capture.save(osp.join(rawdir, "pibooth{:03}.jpg".format(count)))
+    @pibooth.hookimpl
+    def state_processing_do(self, cfg, app, win):
+        if self.processing is None:
+            self.processing = self._worker.submit(self._save_captures, cfg, app)
+            self.processing_step = 'captures'
 
-        LOGGER.info("Creating the final picture")
-        default_factory = get_picture_factory(captures, cfg.get('PICTURE', 'orientation'))
-        factory = self._pm.hook.pibooth_setup_picture_factory(cfg=cfg,
-                                                              opt_index=idx,
-                                                              factory=default_factory)
-        app.previous_picture = factory.build()
+        if self.processing_step == 'done' or not self.processing.done():
+            return  # Let the window and the other plugins live
 
-        for savedir in cfg.gettuple('GENERAL', 'directory', 'path'):
-            app.previous_picture_file = osp.join(savedir, app.picture_filename)
-            factory.save(app.previous_picture_file)
-
-        if cfg.getboolean('WINDOW', 'animate') and app.capture_nbr > 1:
-            LOGGER.info("Asyncronously generate pictures for animation")
-            for capture in captures:
-                default_factory = get_picture_factory((capture,), cfg.get(
-                    'PICTURE', 'orientation'), force_pil=True, dpi=200)
-                factory = self._pm.hook.pibooth_setup_picture_factory(cfg=cfg,
-                                                                      opt_index=idx,
-                                                                      factory=default_factory)
-                factory.set_margin(factory._margin // 3)  # 1/3 since DPI is divided by 3
-                self.factory_pool.add(factory)
+        result = self.processing.result()  # Raise worker exception if any
+        idx = app.capture_choices.index(app.capture_nbr)
+
+        if self.processing_step == 'captures':
+            self.captures = result
+            # Captures already drawn by the worker (jobs done before this one)
+            if self.progressive_factory and len(self.progressive_jobs) == len(self.captures)\
+                    and not any(job.exception() for job in self.progressive_jobs):
+                factory = self.progressive_factory
+            else:
+                if self.progressive_factory:
+                    LOGGER.warning("Progressive picture composition failed, build it from scratch")
+                factory = self._setup_factory(cfg, app, self.captures)
+            self.progressive_factory = None
+            self.progressive_jobs = []
+
+            paths = [osp.join(savedir, app.picture_filename) for savedir in cfg.gettuple('GENERAL', 'directory', 'path')]
+            self.processing = self._worker.submit(self._save_picture, factory, paths,
+                                                  win.display_size if win else None)
+            self.processing_step = 'picture'
+            self.picture_file = paths[-1]
+
+        elif self.processing_step == 'picture':
+            app.previous_picture, mipmaps = result
+            if win:
+                win.set_mipmaps(app.previous_picture, mipmaps)
+            app.previous_picture_file = self.picture_file
+            self.processing_step = 'done'
+
+            if cfg.getboolean('WINDOW', 'animate') and app.capture_nbr > 1:
+                LOGGER.info("Asyncronously generate pictures for animation")
+                for capture in self.captures:
+                    default_factory = get_picture_factory((capture,), cfg.get(
+                        'PICTURE', 'orientation'), force_pil=True, dpi=ANIMATION_DPI)
+                    factory = self._pm.hook.pibooth_setup_picture_factory(cfg=cfg,
+                                                                          opt_index=idx,
+                                                                          factory=default_factory)
+                    scale_margins(factory, ANIMATION_DPI)
+                    self.factory_pool.add(factory)
+            self.captures = None
+
+    @pibooth.hookimpl(hookwrapper=True)
+    def state_processing_validate(self):
+        outcome = yield  # all corresponding hookimpls are invoked here
+        if self.processing_step != 'done':
+            outcome.force_result(None)  # Final picture not yet ready
 
     @pibooth.hookimpl
     def state_processing_exit(self, app):
         app.count.taken += 1  # Do it here because 'print' state can be skipped
 
     @pibooth.hookimpl
-    def state_print_do(self, cfg, app, events):
+    def state_print_do(self, cfg, app, win, events):
         if app.find_capture_event(events):
 
             LOGGER.info("Moving the picture in the forget folder")
@@ -150,10 +276,11 @@ class PicturePlugin(object):
                     os.makedirs(forgetdir)
                 os.rename(osp.join(savedir, app.picture_filename), osp.join(forgetdir, app.picture_filename))
 
-            self._reset_vars(app)
-            app.count.forgotten += 1
+            self._reset_vars(app, win)
             app.previous_picture = self.second_previous_picture
 
-            # Deactivate the print function for the backuped picture
-            # as we don't known how many times it has already been printed
-            app.count.remaining_duplicates = 0
+            with app.count.transaction():
+                app.count.forgotten += 1
+                # Deactivate the print function for the backuped picture
+                # as we don't known how many times it has already been printed
+                app.count.remaining_duplicates = 0
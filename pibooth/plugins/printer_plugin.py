@@ -13,13 +13,16 @@ class PrinterPlugin(object):
 
     def __init__(self, plugin_manager):
         self._pm = plugin_manager
+        self.auto_printed = False
 
     def print_picture(self, cfg, app):
         LOGGER.info("Send final picture to printer")
-        app.printer.print_file(app.previous_picture_file,
-                               cfg.getint('PRINTER', 'pictures_per_page'))
-        app.count.printed += 1
-        app.count.remaining_duplicates -= 1
+        if app.printer.print_file(app.previous_picture_file,
+                                  cfg.getint('PRINTER', 'pictures_per_page'),
+                                  app.previous_picture):
+            with app.count.transaction():
+                app.count.printed += 1
+                app.count.remaining_duplicates -= 1
 
     @pibooth.hookimpl
     def pibooth_cleanup(self, app):
@@ -50,10 +53,13 @@ class PrinterPlugin(object):
     @pibooth.hookimpl
     def state_processing_enter(self, cfg, app):
         app.count.remaining_duplicates = cfg.getint('PRINTER', 'max_duplicates')
+        self.auto_printed = False
 
     @pibooth.hookimpl
     def state_processing_do(self, cfg, app):
-        if app.previous_picture_file and app.printer.is_ready():
+        # Picture is generated asynchronously: wait for it, then print it once
+        if app.previous_picture_file and not self.auto_printed and app.printer.is_ready():
+            self.auto_printed = True
             number = cfg.gettyped('PRINTER', 'auto_print')
             if number == 'max':
                 number = cfg.getint('PRINTER', 'max_duplicates')
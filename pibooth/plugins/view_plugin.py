@@ -53,7 +53,7 @@ class ViewPlugin(object):
         win.show_intro(previous_picture, app.printer.is_ready()
                        and app.count.remaining_duplicates > 0)
         if app.printer.is_installed():
-            win.set_print_number(len(app.printer.get_all_tasks()), not app.printer.is_ready())
+            win.set_print_number(app.printer.get_queue_length(), not app.printer.is_ready())
 
     @pibooth.hookimpl
     def state_wait_do(self, app, win, events):
@@ -67,8 +67,7 @@ class ViewPlugin(object):
 
         event = app.find_print_status_event(events)
         if event and app.printer.is_installed():
-            tasks = app.printer.get_all_tasks()
-            win.set_print_number(len(tasks), not app.printer.is_ready())
+            win.set_print_number(app.printer.get_queue_length(), not app.printer.is_ready())
 
         if app.find_print_event(events) or (win.get_image() and not previous_picture):
             win.show_intro(previous_picture, app.printer.is_ready()
@@ -153,7 +152,7 @@ class ViewPlugin(object):
     def state_print_enter(self, cfg, app, win):
         LOGGER.info("Display the final picture")
         win.show_print(app.previous_picture)
-        win.set_print_number(len(app.printer.get_all_tasks()), not app.printer.is_ready())
+        win.set_print_number(app.printer.get_queue_length(), not app.printer.is_ready())
 
         # Reset timeout in case of settings changed
         self.print_view_timer.timeout = cfg.getfloat('PRINTER', 'printer_delay')
@@ -165,7 +164,7 @@ class ViewPlugin(object):
         self.forgotten = app.find_capture_event(events)
         if self.print_view_timer.is_timeout() or printed or self.forgotten:
             if printed:
-                win.set_print_number(len(app.printer.get_all_tasks()), not app.printer.is_ready())
+                win.set_print_number(app.printer.get_queue_length(), not app.printer.is_ready())
             return 'finish'
 
     @pibooth.hookimpl
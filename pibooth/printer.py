@@ -9,7 +9,14 @@ try:
 except ImportError:
     cups = None  # CUPS is optional
 
+import os
+import re
+import time
+import queue
+import shutil
 import tempfile
+import collections
+import threading
 import os.path as osp
 
 import pygame
@@ -20,6 +27,12 @@ from pibooth.pictures import get_picture_factory
 
 PRINTER_TASKS_UPDATED = pygame.USEREVENT + 2
 
+# Maximum time (in seconds) between two requests of the jobs list to CUPS
+# while jobs are in progress (in case of missed notifications)
+RECONCILE_PERIOD = 30
+
+JOB_ATTRIBUTES = ["job-id", "job-name", "job-uri", "job-state"]
+
 PAPER_FORMATS = {
     '2x6': (2, 6),      # 2x6 pouces - 5x15 cm - 51x152 mm
     '3,5x5': (3.5, 5),  # 3,5x5 pouces - 9x13 cm - 89x127 mm
@@ -30,12 +43,70 @@ PAPER_FORMATS = {
 }
 
 
+# Size of media given in PWG self-describing names (e.g. 'na_index-4x6_4x6in')
+MEDIA_SIZE_REGEX = re.compile(r'_(\d+(?:\.\d+)?)x(\d+(?:\.\d+)?)(in|mm)$')
+
+
+def get_paper_format(name):
+    """Return the paper size in inches from its name (a key of PAPER_FORMATS
+    or ``<width>x<height>``).
+
+    :param name: paper format name
+    :type name: str
+
+    :return: size (width, height) in inches
+    :rtype: tuple
+    """
+    if name in PAPER_FORMATS:
+        return PAPER_FORMATS[name]
+    try:
+        width, height = name.split('x')
+        return (float(width), float(height))
+    except ValueError:
+        raise ValueError("invalid paper format '{}'".format(name))
+
+
 class Printer(object):
 
-    def __init__(self, name='default', max_pages=-1, options=None, counters=None):
+    """Printer handling through CUPS. The files are sent to CUPS by a worker
+    thread (having its own connection) in the order of submission, the end
+    of each job is notified by a ``PRINTER_TASKS_UPDATED`` event.
+
+    The jobs in progress are kept in memory. The table is filled with the
+    files sent by the worker and refreshed by the worker (full request of
+    the jobs list) when a CUPS notification is received, or periodically
+    while jobs are in progress. Thus reading it does not request CUPS.
+
+    The resolution and the printable area used to render the pictures are
+    read from the printer driver (IPP attributes or PPD file), the given
+    paper format and resolution are used if they are not available.
+
+    :param max_jobs: maximum number of files waiting to be sent to CUPS
+    :type max_jobs: int
+    :param paper_format: paper size in inches if not given by the driver
+    :type paper_format: tuple
+    :param dpi: resolution if not given by the driver
+    :type dpi: int
+    """
+
+    def __init__(self, name='default', max_pages=-1, options=None, counters=None, max_jobs=10,
+                 paper_format=(4, 6), dpi=600):
         self._conn = cups.Connection() if cups else None
         self._notifier = Subscriber(self._conn) if cups else None
+        self._jobs = queue.Queue(max_jobs)
+        self._worker = None
+        self._tasks = {}
+        self._tasks_lock = threading.Lock()
+        self._reconciled_at = 0
+        self._stale = threading.Event()
+        self._events = collections.deque()
+        self._sheets = {}  # (filename, copies) -> page file (used by the worker)
+        self._sheets_dir = None  # Temporary folder of the pages
+        self._native_format = None
+        self._native_dpi = None
         self.name = None
+        self.paper_format = paper_format
+        self.dpi = dpi
         self.max_pages = max_pages
         self.options = options
         self.count = counters
@@ -57,6 +128,8 @@ class Printer(object):
                 LOGGER.warning("No printer named '%s' in CUPS (see http://localhost:631)", name)
         else:
             LOGGER.info("Connected to printer '%s'", self.name)
+            self._reconcile(self._conn)
+            self._read_profile()
 
         if self.options and not isinstance(self.options, dict):
             LOGGER.warning("Invalid printer options '%s', dict is expected", self.options)
@@ -69,7 +142,76 @@ class Printer(object):
         Call for each new printer event.
         """
         LOGGER.info(evt.title)
-        pygame.event.post(pygame.event.Event(PRINTER_TASKS_UPDATED, evt=evt))
+        # The notification does not give the job ID, the event is posted
+        # by the worker once the jobs table is refreshed
+        self._events.append(evt)
+        self._stale.set()
+
+    def _reconcile(self, conn):
+        """Replace the jobs table by the jobs list requested to CUPS.
+        """
+        try:
+            tasks = conn.getJobs(my_jobs=True, requested_attributes=JOB_ATTRIBUTES)
+        except Exception as ex:
+            LOGGER.warning("Can not get the printer jobs: %s", ex)
+            return
+        with self._tasks_lock:
+            self._tasks = tasks
+            self._reconciled_at = time.time()
+
+    def _read_profile(self):
+        """Read the resolution and the printable area of the printer. The
+        PPD file gives the imageable area (without margins), the IPP
+        attributes give the default media size.
+        """
+        try:
+            attrs = self._conn.getPrinterAttributes(self.name, requested_attributes=[
+                'printer-resolution-default', 'media-default'])
+        except Exception as ex:
+            LOGGER.debug("Can not get IPP attributes of printer '%s': %s", self.name, ex)
+            attrs = {}
+
+        resolution = attrs.get('printer-resolution-default')
+        if resolution and resolution[2] in (3, 4):  # Dots per inch or per centimeter
+            self._native_dpi = int(round(min(resolution[:2]) * (2.54 if resolution[2] == 4 else 1)))
+        match = MEDIA_SIZE_REGEX.search(attrs.get('media-default') or '')
+        if match:
+            factor = 25.4 if match.group(3) == 'mm' else 1
+            self._native_format = (float(match.group(1)) / factor, float(match.group(2)) / factor)
+
+        try:
+            filename = self._conn.getPPD(self.name)
+        except Exception as ex:
+            LOGGER.debug("No PPD file for printer '%s': %s", self.name, ex)
+            filename = None
+        if filename:
+            try:
+                ppd = cups.PPD(filename)
+                if not self._native_dpi:
+                    attr = ppd.findAttr('DefaultResolution')
+                    match = re.match(r'(\d+)(?:x(\d+))?dpi', attr.value if attr else '')
+                    if match:
+                        self._native_dpi = min(int(value) for value in match.groups() if value)
+                option = ppd.findOption('PageSize')
+                attr = ppd.findAttr('ImageableArea', option.defchoice) if option else None
+                if attr:  # Lower left and upper right corners in points
+                    left, bottom, right, top = [float(value) for value in attr.value.split()]
+                    self._native_format = ((right - left) / 72, (top - bottom) / 72)
+            except Exception as ex:
+                LOGGER.debug("Can not read PPD file of printer '%s': %s", self.name, ex)
+            finally:
+                os.remove(filename)
+
+        LOGGER.info("Printer '%s' profile: %s dpi, %s inches", self.name, *self.get_profile()[::-1])
+
+    def get_profile(self):
+        """Return the printable area and the resolution of the printer (or
+        the default ones if not given by the driver).
+
+        :return: size (width, height) in inches and resolution in dpi
+        :rtype: tuple
+        """
+        return self._native_format or self.paper_format, self._native_dpi or self.dpi
 
     def is_installed(self):
         """Return True if the CUPS server is available for printing.
@@ -85,8 +227,25 @@ class Printer(object):
             return True
         return self.count.printed < self.max_pages
 
-    def print_file(self, filename, copies=1):
-        """Send a file to the CUPS server to the default printer.
+    def print_file(self, filename, copies=1, image=None):
+        """Send a file to the CUPS server to the default printer. The file is
+        queued and sent by the worker thread, this method does not block.
+
+        If several pictures are printed on the page, the page is built by the
+        worker when the file is printed for the first time, then reused for
+        the duplicates (see :py:meth:`_build_sheet`).
+
+        :param filename: path to the file to print
+        :type filename: str
+        :param copies: number of pictures on the page
+        :type copies: int
+        :param image: picture saved in ``filename`` (PIL image) used to build
+                      the page instead of decoding the file
+        :type image: :py:class:`PIL.Image`
+
+        :return: False if the queue is full or CUPS is not reachable (the
+                 file is not printed)
+        :rtype: bool
         """
         if not self.name:
             raise EnvironmentError("No printer found (check config file or CUPS config)")
@@ -99,18 +258,111 @@ class Printer(object):
                                                       event.CUPS_EVT_PRINTER_STATE_CHANGED,
                                                       event.CUPS_EVT_PRINTER_STOPPED])
 
-        if copies > 1:
-            with tempfile.NamedTemporaryFile(suffix=osp.basename(filename)) as fp:
-                picture = Image.open(filename)
-                factory = get_picture_factory((picture,) * copies)
-                # Don't call setup factory hook here, as the selected parameters
-                # are the one necessary to render several pictures on same page.
-                factory.set_margin(2)
-                factory.save(fp.name)
-                self._conn.printFile(self.name, fp.name, osp.basename(filename), self.options)
-        else:
-            self._conn.printFile(self.name, filename, osp.basename(filename), self.options)
+        if not self._start_worker():
+            LOGGER.warning("Printer worker not running, '%s' is not printed", filename)
+            return False
+        try:
+            self._jobs.put_nowait(('print', filename, copies, image))
+        except queue.Full:
+            LOGGER.warning("Too many files waiting to be sent to the printer, '%s' is not printed", filename)
+            return False
+        return True
+
+    def _start_worker(self):
+        """Start the worker thread with its own CUPS connection (nothing is
+        done if already running). A dead worker is restarted, the files
+        still queued are sent by the new one.
+
+        :return: False if the connection to CUPS failed
+        :rtype: bool
+        """
+        if self._worker and self._worker.is_alive():
+            return True
+        try:
+            conn = cups.Connection()  # A connection shall not be shared between threads
+        except Exception as ex:
+            LOGGER.error("Can not connect to CUPS: %s", ex)
+            return False
+        self._worker = threading.Thread(target=self._run, args=(conn,), name='printer', daemon=True)
+        self._worker.start()
+        return True
+
+    def _run(self, conn):
+        """Send the queued files to CUPS and build the pages of several
+        pictures (executed by the worker thread).
+        """
+        while True:
+            try:
+                job = self._jobs.get(timeout=0.5)
+            except queue.Empty:
+                job = ()
+            if job is None:
+                break
+            if job:
+                _, filename, copies, image = job
+                try:
+                    job_id = self._send_file(conn, filename, copies, image)
+                    with self._tasks_lock:
+                        self._tasks[job_id] = {'job-id': job_id, 'job-name': osp.basename(filename),
+                                               'job-state': 3}  # IPP_JOB_PENDING
+                    error = None
+                except Exception as ex:
+                    LOGGER.error("Can not send file '%s' to the printer: %s", filename, ex)
+                    error = str(ex)
+                pygame.event.post(pygame.event.Event(PRINTER_TASKS_UPDATED, evt=None,
+                                                     filename=filename, error=error))
+
+            if self._stale.is_set() or (self._tasks and time.time() - self._reconciled_at > RECONCILE_PERIOD):
+                self._stale.clear()
+                self._reconcile(conn)
+            while self._events:
+                pygame.event.post(pygame.event.Event(PRINTER_TASKS_UPDATED, evt=self._events.popleft(),
+                                                     filename=None, error=None))
+
+    def _build_sheet(self, filename, copies, image=None):
+        """Build the page made of several copies of the picture (decoded
+        from the file if not given) and return its path. The page is saved
+        in a temporary folder and reused for the duplicates, the pages of
+        the previous pictures are removed.
+        """
+        key = (osp.abspath(filename), copies)
+        if key in self._sheets:
+            return self._sheets[key]
+        self._remove_sheets()
+        if not self._sheets_dir:
+            self._sheets_dir = tempfile.mkdtemp(prefix='pibooth-sheets-')
+        sheet = osp.join(self._sheets_dir, '{}_{}up.jpg'.format(osp.splitext(osp.basename(filename))[0], copies))
+        if image is None:
+            image = Image.open(filename)
+        paper_format, dpi = self.get_profile()
+        factory = get_picture_factory((image,) * copies, paper_format=paper_format, dpi=dpi)
+        # Don't call setup factory hook here, as the selected parameters
+        # are the one necessary to render several pictures on same page.
+        factory.set_margin(2)
+        factory.save(sheet)
+        self._sheets[key] = sheet
+        return sheet
+
+    def _remove_sheets(self):
+        """Remove the pages built for the previous pictures (the file is
+        copied by CUPS when the job is created).
+        """
+        for sheet in self._sheets.values():
+            LOGGER.debug("Remove page '%s'", sheet)
+            try:
+                os.remove(sheet)
+            except OSError as ex:
+                LOGGER.warning("Can not remove page '%s': %s", sheet, ex)
+        self._sheets.clear()
+
+    def _send_file(self, conn, filename, copies=1, image=None):
+        """Send a file to CUPS using the given connection and return the
+        job ID.
+        """
+        path = self._build_sheet(filename, copies, image) if copies > 1 else filename
+        job_id = conn.printFile(self.name, path, osp.basename(filename), self.options)
         LOGGER.debug("File '%s' sent to the printer with options %s", filename, self.options)
+        return job_id
 
     def cancel_all_tasks(self):
         """Cancel all tasks in the queue.
@@ -118,18 +370,38 @@ class Printer(object):
         if not self.name:
             raise EnvironmentError("No printer found (check config file or CUPS config)")
         self._conn.cancelAllJobs(self.name)
+        self._reconcile(self._conn)
 
     def get_all_tasks(self):
         """Return a dict (indexed by job ID) of dicts representing all tasks
-        in the queue.
+        in the queue (CUPS is not requested).
         """
-        if not self.name:
-            return {}  # No printer found
-        return self._conn.getJobs(my_jobs=True, requested_attributes=["job-id", "job-name",
-                                                                      "job-uri", "job-state"])
+        with self._tasks_lock:
+            return dict(self._tasks)
+
+    def get_queue_length(self):
+        """Return the number of tasks in the queue, including the files
+        waiting to be sent to CUPS.
+        """
+        with self._jobs.mutex:
+            waiting = sum(1 for job in self._jobs.queue if job and job[0] == 'print')
+        with self._tasks_lock:
+            return len(self._tasks) + waiting
 
     def quit(self):
-        """Do cleanup actions.
+        """Do cleanup actions. The files already queued are sent to CUPS
+        (waiting at most 10 seconds).
         """
+        if self._worker:
+            try:
+                self._jobs.put(None, timeout=10)
+            except queue.Full:
+                pass  # Worker blocked by CUPS, it is a daemon thread
+            self._worker.join(10)
+            self._worker = None
+        if self._sheets_dir:
+            shutil.rmtree(self._sheets_dir, ignore_errors=True)
+            self._sheets_dir = None
+            self._sheets.clear()
         if self._notifier:
             self._notifier.unsubscribe_all()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""Pibooth benchmark module.
+"""
+
+import os
+import json
+import time
+import platform
+import tempfile
+import argparse
+import tracemalloc
+import os.path as osp
+from collections import OrderedDict
+
+# Keep standard output clean for JSON results (pygame is imported by printer module)
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import PIL
+from PIL import Image
+
+import pibooth
+from pibooth import pictures
+from pibooth.pictures import factory as factory_module
+from pibooth.pictures.cache import CACHE
+from pibooth.pictures.output import save_image
+from pibooth.printer import PAPER_FORMATS
+from pibooth.utils import LOGGER, configure_logging
+
+
+BACKENDS = OrderedDict((('pil', factory_module.PilPictureFactory),
+                        ('opencv', factory_module.OpenCvPictureFactory)))
+
+STAGES = ('background', 'matrix', 'final', 'texts', 'save')
+
+VARIANTS = ('plain', 'crop', 'overlay', 'texts')
+
+TEXTS = (('This is the main title', 'Amatic-Bold', (10, 0, 0), 'left'),
+         ('Footer text 2', 'DancingScript-Regular', (0, 50, 0), 'center'),
+         ('Footer text 3', 'Roboto-LightItalic', (0, 50, 50), 'right'))
+
+
+def get_environment():
+    """Return the versions of the components having an impact on the
+    benchmark results.
+    """
+    env = OrderedDict()
+    env['pibooth'] = pibooth.__version__
+    env['python'] = platform.python_version()
+    env['pillow'] = PIL.__version__
+    env['opencv'] = factory_module.cv2.__version__ if factory_module.cv2 else None
+    env['numpy'] = factory_module.np.__version__ if factory_module.cv2 else None
+    env['machine'] = platform.machine()
+    env['platform'] = platform.platform()
+    env['cpus'] = os.cpu_count()
+    return env
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of the process to the current one
+    (Linux only, see ``/proc/<pid>/clear_refs``).
+
+    :return: False if the peak can not be reset on this platform
+    :rtype: bool
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the process in kilobytes since
+    the last call to :py:func:`reset_peak_rss`.
+    """
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return None
+
+
+def load_captures(captures_dir, orientation, count):
+    """Return the decoded captures and the overlay path for the given
+    orientation. Available captures are repeated if not enough.
+    """
+    folder = osp.join(captures_dir, orientation)
+    names = sorted(os.listdir(folder))
+    captures = []
+    for name in [name for name in names if name.startswith('capture')]:
+        image = Image.open(osp.join(folder, name))
+        image.load()  # Decoding is not part of the benchmark
+        captures.append(image)
+    if not captures:
+        raise ValueError("No capture found in '{}'".format(folder))
+    captures = [captures[i % len(captures)] for i in range(count)]
+
+    overlays = [name for name in names if name.startswith('overlay')]
+    overlay = 'overlay{}.png'.format(count - 1)
+    if overlay not in overlays:
+        overlay = overlays[0] if overlays else None
+    return captures, osp.join(folder, overlay) if overlay else None
+
+
+def setup_factory(factory, variant, background, overlay):
+    """Configure the factory for the given variant.
+    """
+    factory.set_background(background)
+    if variant == 'crop':
+        factory.set_cropping()
+    elif variant == 'overlay' and overlay:
+        factory.set_overlay(overlay)
+    elif variant == 'texts':
+        for text in TEXTS:
+            factory.add_text(*text)
+
+
+def run_stages(factory, path, cold=True):
+    """Build the final picture stage by stage and return the time (in
+    seconds) spent in each one.
+    """
+    if cold:
+        factory_module._TEMPLATES.clear()
+        CACHE.clear()
+
+    timings = OrderedDict()
+    start = time.perf_counter()
+    image = factory._get_background()
+    timings['background'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = factory._build_matrix(image)
+    timings['matrix'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = factory._build_final_image(image)
+    timings['final'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    factory._build_texts(image)
+    timings['texts'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_image(image, path)
+    timings['save'] = time.perf_counter() - start
+    return timings
+
+
+def bench_factory(factory_class, captures, size, variant, background, overlay,
+                  path, repeat=3, cold=True):
+    """Benchmark the build of a picture. The best time of each stage is kept
+    and the memory allocated by Python is measured during an additional
+    build. The peak resident set size of the timed builds is None if it can
+    not be measured on this platform.
+
+    :return: stages timings and memory peaks
+    :rtype: dict
+    """
+    result = OrderedDict()
+    result['stages'] = OrderedDict((stage, None) for stage in STAGES)
+    rss_available = reset_peak_rss()
+    for _ in range(repeat):
+        factory = factory_class(size[0], size[1], *captures)
+        setup_factory(factory, variant, background, overlay)
+        for stage, duration in run_stages(factory, path, cold).items():
+            if result['stages'][stage] is None or duration < result['stages'][stage]:
+                result['stages'][stage] = duration
+    result['total'] = sum(result['stages'].values())
+    result['peak_rss'] = get_peak_rss() if rss_available else None
+
+    # Tracing slows down the build, measure it separately
+    factory = factory_class(size[0], size[1], *captures)
+    setup_factory(factory, variant, background, overlay)
+    tracemalloc.start()
+    try:
+        run_stages(factory, path, cold)
+        result['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def iter_benchmarks(options):
+    """Yield the result of each combination of parameters selected by the
+    command line options.
+    """
+    background = osp.join(options.captures_dir, 'fond.jpg')
+    with tempfile.TemporaryDirectory(prefix='pibooth-bench') as tmpdir:
+        path = osp.join(tmpdir, 'picture.jpg')
+        for backend in options.backends:
+            if backend == 'opencv' and not factory_module.cv2:
+                LOGGER.warning("OpenCV is not installed, skip '%s' backend", backend)
+                continue
+            for orientation in options.orientations:
+                for count in options.captures:
+                    captures, overlay = load_captures(options.captures_dir, orientation, count)
+                    for paper_format in options.formats:
+                        size = [int(dim * options.dpi) for dim in PAPER_FORMATS[paper_format]]
+                        if orientation == pictures.LANDSCAPE:
+                            size.reverse()
+                        for variant in options.variants:
+                            LOGGER.info("Bench %s, %s, %s captures, %s, %s", backend, orientation,
+                                        count, paper_format, variant)
+                            result = OrderedDict()
+                            result['backend'] = backend
+                            result['orientation'] = orientation
+                            result['captures'] = count
+                            result['format'] = paper_format
+                            result['size'] = size
+                            result['variant'] = variant
+                            try:
+                                result.update(bench_factory(BACKENDS[backend], captures, size, variant,
+                                                            background, overlay, path,
+                                                            options.repeat, not options.warm))
+                            except Exception as ex:
+                                LOGGER.error("Bench failed: %s", ex)
+                                result['error'] = str(ex)
+                            yield result
+
+
+def main():
+    """Application entry point.
+    """
+    parser = argparse.ArgumentParser(usage="%(prog)s factory [options]",
+                                     description="This script measures the performances of the pictures generation.")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    factory_parser = subparsers.add_parser('factory', help=u"benchmark the picture factories")
+    factory_parser.add_argument("--captures-dir", required=True,
+                                help=u"folder containing 'portrait' and 'landscape' captures and 'fond.jpg' "
+                                "background (e.g. 'tests/captures' of the sources)")
+    factory_parser.add_argument("--backend", dest='backends', action='append', choices=list(BACKENDS),
+                                help=u"picture factory to benchmark (default: all)")
+    factory_parser.add_argument("--orientation", dest='orientations', action='append',
+                                choices=[pictures.PORTRAIT, pictures.LANDSCAPE],
+                                help=u"picture orientation (default: all)")
+    factory_parser.add_argument("--captures", action='append', type=int, choices=[1, 2, 3, 4],
+                                help=u"number of captures (default: all)")
+    factory_parser.add_argument("--format", dest='formats', action='append', choices=sorted(PAPER_FORMATS),
+                                help=u"paper format (default: all)")
+    factory_parser.add_argument("--variant", dest='variants', action='append', choices=VARIANTS,
+                                help=u"layout variant (default: all)")
+    factory_parser.add_argument("--dpi", type=int, default=600,
+                                help=u"pictures resolution (default: %(default)s)")
+    factory_parser.add_argument("--repeat", type=int, default=3,
+                                help=u"number of builds per combination, best time is kept (default: %(default)s)")
+    factory_parser.add_argument("--warm", action='store_true',
+                                help=u"keep compiled layouts and images in cache between builds")
+    factory_parser.add_argument("--output", help=u"write JSON results in this file instead of stdout")
+
+    options = parser.parse_args()
+    options.backends = options.backends or list(BACKENDS)
+    options.orientations = options.orientations or [pictures.PORTRAIT, pictures.LANDSCAPE]
+    options.captures = options.captures or [1, 2, 3, 4]
+    options.formats = options.formats or sorted(PAPER_FORMATS)
+    options.variants = options.variants or list(VARIANTS)
+    if not osp.isdir(options.captures_dir):
+        parser.error("captures folder '{}' not found".format(options.captures_dir))
+
+    if options.output:
+        configure_logging()  # Console is used for JSON output otherwise
+
+    report = OrderedDict()
+    report['environment'] = get_environment()
+    report['dpi'] = options.dpi
+    report['repeat'] = options.repeat
+    report['cold'] = not options.warm
+    report['results'] = list(iter_benchmarks(options))
+
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        LOGGER.info("Results written in '%s'", options.output)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,63 +4,311 @@
 """
 
 import os
+import json
+import time
+import hashlib
 import argparse
 from os import path as osp
-from datetime import datetime
+from datetime import datetime, timedelta
+from collections import deque
 
-from PIL import Image
+from PIL.Image import Resampling
+
+import psutil
 
 from pibooth.utils import LOGGER, configure_logging
 from pibooth.plugins import create_plugin_manager
 from pibooth.config import PiConfigParser
-from pibooth.pictures import get_picture_factory
+from pibooth.pictures import get_picture_factory, open_image, scale_margins
+from pibooth.pictures.output import write_bytes, save_image
+from pibooth.pictures.cache import CACHE
+from pibooth.pictures.pool import _get_context, _init_worker
+from pibooth.printer import get_paper_format
 from pibooth.counters import Counters
 
 
+MANIFEST_FILENAME = '.pibooth_regen.json'
+
+# Resolution and paper format not defined are the ones of the [PRINTER] section
+DEFAULT_PROFILE = {'dpi': None, 'paper': None, 'option': None, 'quality': None,
+                   'dest': '{folder}_pibooth.jpg'}
+
+
+def parse_profile(text):
+    """Return the output profile defined by the given text, a comma separated
+    list of ``key=value`` (keys are those of :py:data:`DEFAULT_PROFILE`).
+
+    :param text: profile definition (e.g. ``dpi=150,quality=80,dest=web/{folder}.jpg``)
+    :type text: str
+
+    :return: profile
+    :rtype: dict
+    """
+    profile = dict(DEFAULT_PROFILE)
+    for item in text.split(','):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in profile or not value.strip():
+            raise ValueError("invalid profile item '{}'".format(item))
+        profile[key] = value.strip()
+    for key in ('dpi', 'option', 'quality'):
+        if profile[key] is not None:
+            profile[key] = int(profile[key])
+    if profile['option'] not in (None, 0, 1):
+        raise ValueError("profile option index shall be 0 or 1")
+    if profile['paper'] is not None:
+        get_paper_format(profile['paper'])
+    return profile
+
+
+def get_printer_profile(config, profile):
+    """Return the given profile with the resolution and the paper format of
+    the ``[PRINTER]`` section of the configuration if not defined.
+
+    :param config: application configuration
+    :type config: :py:class:`pibooth.config.parser.PiConfigParser`
+    :param profile: profile returned by :py:func:`parse_profile`
+    :type profile: dict
+
+    :return: profile
+    :rtype: dict
+    """
+    profile = dict(profile)
+    if profile['dpi'] is None:
+        profile['dpi'] = config.getint('PRINTER', 'dpi')
+    if profile['paper'] is None:
+        profile['paper'] = config.get('PRINTER', 'paper_format')
+    return profile
+
+
 def get_captures(images_folder):
-    """Get a list of images from the folder given in input.
+    """Get a list of images from the folder given in input. The images are
+    not loaded: the picture factory decodes them at the needed scale and
+    applies their EXIF orientation.
     """
-    captures_paths = os.listdir(images_folder)
+    captures_paths = sorted(os.listdir(images_folder))
     captures = []
     for capture_path in captures_paths:
         try:
-            image = Image.open(osp.join(images_folder, capture_path))
-            captures.append(image)
+            captures.append(open_image(osp.join(images_folder, capture_path)))
         except OSError:
             LOGGER.info("File %s doesn't seem to be an image", capture_path)
     return captures
 
 
-def regenerate_all_images(plugin_manager, config, basepath):
-    """Regenerate the pibboth images from the raw images and the config.
+def load_manifest(basepath):
+    """Return the manifest of the pictures previously generated in the given
+    folder. It records, per raw folder, the settings hash of the picture
+    factory and the raw files signature.
     """
-    if not osp.isdir(osp.join(basepath, 'raw')):
-        return
+    path = osp.join(basepath, MANIFEST_FILENAME)
+    if osp.isfile(path):
+        try:
+            with open(path) as fp:
+                return json.load(fp)
+        except ValueError as ex:
+            LOGGER.warning("Ignore invalid manifest '%s' (%s)", path, ex)
+    return {}
+
+
+def save_manifest(basepath, manifest):
+    """Write the manifest atomically (regeneration can be interrupted).
+    """
+    write_bytes(json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'),
+                osp.join(basepath, MANIFEST_FILENAME))
+
 
+def get_raws_signature(images_folder):
+    """Return the size and the modification time of each file of the folder.
+    """
+    signature = {}
+    for name in os.listdir(images_folder):
+        stat = os.stat(osp.join(images_folder, name))
+        signature[name] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+def get_factory_hash(factory, options=None):
+    """Return a hash of the settings of the picture factory (after setup by
+    the plugins) and of the encoder options.
+    """
+    key = (factory._get_template_key(), factory._outlines, sorted((options or {}).items()))
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def _regenerate(images_folder, groups):
+    """Decode the captures once and save the pictures of all groups
+    (executed by a worker process in parallel mode). The first output of
+    each group is built, the other ones are derived from it by resizing.
+    """
+    captures = get_captures(images_folder)
+    try:
+        for group in groups:
+            image = None
+            for factory, picture_file, options, stale in group:
+                if image is None:
+                    factory._images = captures
+                    image = factory.build()
+                    factory._images = []
+                elif image.size != (factory.width, factory.height):
+                    image = image.resize((factory.width, factory.height), Resampling.LANCZOS,
+                                         reducing_gap=3.0)
+                if stale:
+                    dirname = osp.dirname(picture_file)
+                    if not osp.isdir(dirname):
+                        os.makedirs(dirname)
+                    save_image(image, picture_file, **options)
+    finally:
+        for image in captures:
+            image.close()
+
+
+def get_job_nbytes(factory, captures):
+    """Return an estimation of the memory needed to generate the picture:
+    decoded captures, RGB and RGBA versions of the final picture and
+    resized overlay.
+    """
+    nbytes = factory.width * factory.height * (3 + 4 + 4)
+    for image in captures:
+        nbytes += image.size[0] * image.size[1] * 3
+    return nbytes
+
+
+def iter_jobs(plugin_manager, config, basepath, manifest, profiles, force=False, since=None):
+    """Yield (captures folder, groups of outputs, manifest entries, memory
+    estimation) of the sessions having pictures to generate. The outputs
+    having the same paper format and option index are grouped, from the
+    biggest to the smallest. The captures are not decoded: factories are
+    returned without images.
+    """
     capture_choices = config.gettuple('PICTURE', 'captures', int, 2)
+    picture_plugin = plugin_manager.get_plugin('pibooth-core:picture')
 
-    for captures_folder in os.listdir(osp.join(basepath, 'raw')):
+    for captures_folder in sorted(os.listdir(osp.join(basepath, 'raw'))):
         captures_folder_path = osp.join(basepath, 'raw', captures_folder)
         if not osp.isdir(captures_folder_path):
             continue
-        captures = get_captures(captures_folder_path)
-        LOGGER.info("Generating image from raws in folder %s", captures_folder_path)
-
-        if len(captures) == capture_choices[0]:
-            idx = 0
-        elif len(captures) == capture_choices[1]:
-            idx = 1
-        else:
-            LOGGER.warning("Folder %s doesn't contain the correct number of pictures", captures_folder_path)
+        raws = get_raws_signature(captures_folder_path)
+        if since and max([mtime for _, mtime in raws.values()] or [0]) < since.timestamp():
             continue
 
-        default_factory = get_picture_factory(captures, config.get('PICTURE', 'orientation'))
-        factory = plugin_manager.hook.pibooth_setup_picture_factory(cfg=config,
-                                                                    opt_index=idx,
-                                                                    factory=default_factory)
+        captures = get_captures(captures_folder_path)
+        try:
+            if len(captures) == capture_choices[0]:
+                idx = 0
+            elif len(captures) == capture_choices[1]:
+                idx = 1
+            else:
+                LOGGER.warning("Folder %s doesn't contain the correct number of pictures", captures_folder_path)
+                continue
+
+            try:
+                picture_plugin.texts_vars['date'] = datetime.strptime(captures_folder, "%Y-%m-%d-%H-%M-%S")
+            except ValueError:
+                picture_plugin.texts_vars['date'] = datetime.now()
+
+            groups = {}
+            entries = {}
+            for profile in sorted(profiles, key=lambda profile: -profile['dpi']):
+                opt_index = idx if profile['option'] is None else profile['option']
+                default_factory = get_picture_factory(captures, config.get('PICTURE', 'orientation'),
+                                                      get_paper_format(profile['paper']), dpi=profile['dpi'])
+                factory = plugin_manager.hook.pibooth_setup_picture_factory(cfg=config,
+                                                                            opt_index=opt_index,
+                                                                            factory=default_factory)
+                scale_margins(factory, profile['dpi'])
+                factory._images = []  # Decoded by the job
+
+                picture_file = osp.join(basepath, profile['dest'].format(folder=captures_folder))
+                name = osp.relpath(picture_file, basepath)
+                options = {'quality': profile['quality']} if profile['quality'] else {}
+                entry = {'config': get_factory_hash(factory, options), 'raws': raws}
+                stale = force or manifest.get(name) != entry or not osp.isfile(picture_file)
+                if stale:
+                    entries[name] = entry
+                else:
+                    LOGGER.info("Picture %s is up-to-date", picture_file)
+                groups.setdefault((profile['paper'], opt_index), []).append((factory, picture_file, options, stale))
+
+            # Groups without stale output are not generated
+            groups = [group for group in groups.values() if any(output[-1] for output in group)]
+            if groups:
+                nbytes = max(get_job_nbytes(group[0][0], captures) for group in groups)
+                yield captures_folder, groups, entries, nbytes
+        finally:
+            for image in captures:
+                image.close()
+
+
+def _wait_job(basepath, manifest, job, done, total, start):
+    """Wait for the end of the job, update the manifest and report the
+    progress. Return the number of jobs done.
+    """
+    entries, result, _ = job
+    if result is not None:
+        result.get()  # Raise exception of the worker if any
+    manifest.update(entries)
+    save_manifest(basepath, manifest)
+
+    done += 1
+    rate = done / max(time.time() - start, 1e-6)
+    LOGGER.info("Progress: %s/%s sessions (%.2f sessions/s, ETA %s)", done, total, rate,
+                timedelta(seconds=int((total - done) / rate)))
+    return done
+
+
+def regenerate_all_images(plugin_manager, config, basepath, force=False, since=None, jobs=1, profiles=None):
+    """Regenerate the pibboth images from the raw images and the config.
+    Pictures already generated from the same raw images and settings are
+    skipped, except if ``force`` is True.
+
+    :param force: regenerate up-to-date pictures
+    :type force: bool
+    :param since: only regenerate the pictures having raw images modified
+                  after this date
+    :type since: :py:class:`datetime.datetime`
+    :param jobs: number of processes generating pictures in parallel
+                 (0 for the number of CPUs)
+    :type jobs: int
+    :param profiles: output profiles (see :py:func:`parse_profile`)
+    :type profiles: list
+    """
+    if not osp.isdir(osp.join(basepath, 'raw')):
+        return
+
+    manifest = load_manifest(basepath)
+    profiles = [get_printer_profile(config, profile) for profile in profiles or [DEFAULT_PROFILE]]
+    todo = list(iter_jobs(plugin_manager, config, basepath, manifest, profiles, force, since))
+    if not todo:
+        return
+
+    jobs = jobs or psutil.cpu_count()
+    pool = None
+    if jobs > 1:
+        pool = _get_context().Pool(processes=jobs, initializer=_init_worker, initargs=(CACHE.max_bytes,))
+    # Limit the memory needed by the jobs in progress to half of the available one
+    budget = psutil.virtual_memory().available // 2
 
-        picture_file = osp.join(basepath, captures_folder + "_pibooth.jpg")
-        factory.save(picture_file)
+    start = time.time()
+    running = deque()
+    done = 0
+    try:
+        for captures_folder, groups, entries, nbytes in todo:
+            LOGGER.info("Generating images from raws in folder %s", osp.join(basepath, 'raw', captures_folder))
+            args = (osp.join(basepath, 'raw', captures_folder), groups)
+            if pool:
+                while running and (len(running) >= 2 * jobs or sum(job[-1] for job in running) + nbytes > budget):
+                    done = _wait_job(basepath, manifest, running.popleft(), done, len(todo), start)
+                running.append((entries, pool.apply_async(_regenerate, args), nbytes))
+            else:
+                _regenerate(*args)
+                done = _wait_job(basepath, manifest, (entries, None, nbytes), done, len(todo), start)
+        while running:
+            done = _wait_job(basepath, manifest, running.popleft(), done, len(todo), start)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
 
 
 def main():
@@ -70,6 +318,16 @@ def main():
 
     parser.add_argument("config_directory", nargs='?', default="~/.config/pibooth",
                         help=u"path to configuration directory (default: %(default)s)")
+    parser.add_argument("-f", "--force", action='store_true',
+                        help=u"regenerate all pictures, even the up-to-date ones")
+    parser.add_argument("--since", type=datetime.fromisoformat, metavar='DATE',
+                        help=u"only regenerate pictures having captures modified since this date (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("-p", "--profile", dest='profiles', action='append', type=parse_profile, metavar='PROFILE',
+                        help=u"output profile as comma separated key=value among: dpi, paper, option, quality "
+                        "and dest (e.g. 'dpi=150,quality=80,dest=web/{folder}.jpg'), can be repeated "
+                        "(dpi and paper default to the ones of the [PRINTER] section)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help=u"number of pictures generated in parallel, 0 for the number of CPUs (default: %(default)s)")
 
     options = parser.parse_args()
 
@@ -89,12 +347,12 @@ def main():
 
     # Initialize varibales normally done by the app
     picture_plugin = plugin_manager.get_plugin('pibooth-core:picture')
-    picture_plugin.texts_vars['date'] = datetime.now()
     picture_plugin.texts_vars['count'] = Counters(config.join_path("counters.pickle"), taken=0, printed=0, forgotten=0,
                                                   remaining_duplicates=config.getint('PRINTER', 'max_duplicates'))
 
     for path in config.gettuple('GENERAL', 'directory', 'path'):
-        regenerate_all_images(plugin_manager, config, path)
+        regenerate_all_images(plugin_manager, config, path, options.force, options.since, options.jobs,
+                              options.profiles)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of the surfaces displayed by the window.
+"""
+
+from collections import OrderedDict
+import pygame
+from pibooth.utils import LOGGER
+
+
+def get_nbytes(value):
+    """Return the memory size used by the pixels of a surface, a list of
+    surfaces or the surfaces attributes of an object (like backgrounds).
+
+    :param value: surface, list/tuple or object
+    :type value: object
+
+    :return: size in bytes
+    :rtype: int
+    """
+    if isinstance(value, pygame.Surface):
+        return value.get_width() * value.get_height() * value.get_bytesize()
+    if isinstance(value, (list, tuple)):
+        return sum(get_nbytes(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sum(get_nbytes(item) for item in vars(value).values()
+                   if isinstance(item, (pygame.Surface, list, tuple)))
+    return 0
+
+
+class SurfacesCache(object):
+
+    """Cache of surfaces (or objects holding surfaces) with a memory budget.
+    The least recently used entries are dropped when the budget is exceeded.
+
+    Keys are tuples, the first item being the kind of entry (for instance
+    ``'background'`` or ``'foreground'``), which permits targeted invalidation.
+
+    :attr hits: number of entries found in the cache
+    :type hits: int
+    :attr misses: number of entries not found in the cache
+    :type misses: int
+    :attr evictions: number of entries dropped to respect the budget
+    :type evictions: int
+
+    :param max_bytes: memory budget in bytes
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _evict(self):
+        """Drop the least recently used entries until budget is respected.
+        """
+        while self.nbytes > self.max_bytes and self._items:
+            key, (_, nbytes) = self._items.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+            LOGGER.debug("Drop from surfaces cache %s (%s bytes)", key, nbytes)
+
+    def get(self, key, default=None):
+        """Return the entry corresponding to the key and mark it as recently
+        used.
+
+        :param key: entry key
+        :type key: tuple
+        :param default: value returned if not in the cache
+        :type default: object
+        """
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """Add or update an entry. Its memory size is computed again, thus
+        an object holding surfaces shall be put again after being resized.
+        The entry is not kept if bigger than the budget.
+
+        :param key: entry key
+        :type key: tuple
+        :param value: surface or object holding surfaces
+        :type value: object
+        """
+        self.pop(key)
+        nbytes = get_nbytes(value)
+        if nbytes <= self.max_bytes:
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def pop(self, key, default=None):
+        """Remove the entry and return it.
+
+        :param key: entry key
+        :type key: tuple
+        :param default: value returned if not in the cache
+        :type default: object
+        """
+        if key not in self._items:
+            return default
+        value, nbytes = self._items.pop(key)
+        self.nbytes -= nbytes
+        return value
+
+    def invalidate(self, kind, *items):
+        """Remove the entries of the given kind, having keys starting by the
+        given items.
+
+        :param kind: kind of entries to remove
+        :type kind: str
+        :param items: first items of the keys (after the kind)
+        :type items: object
+        """
+        prefix = (kind,) + items
+        for key in [key for key in list(self._items) if key[:len(prefix)] == prefix]:
+            self.pop(key)
+
+    def clear(self):
+        """Drop all entries.
+        """
+        self._items.clear()
+        self.nbytes = 0
+
+    def get_stats(self):
+        """Return the counters of the cache (for debugging purpose).
+
+        :rtype: dict
+        """
+        return {'entries': len(self._items), 'nbytes': self.nbytes, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
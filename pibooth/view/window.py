@@ -5,17 +5,26 @@
 
 import os
 import time
+import weakref
+import itertools
 import contextlib
+from collections import OrderedDict
 import pygame
 from pygame import gfxdraw
 from PIL import Image
 from PIL.Image import Resampling
 from pibooth import pictures, fonts
 from pibooth.view import background
+from pibooth.view.cache import SurfacesCache
+from pibooth.pictures.cache import get_memory_budget
 from pibooth.utils import LOGGER
 from pibooth.pictures import sizing
 
 
+# Part of the available memory used to keep the displayed surfaces
+SURFACES_MEMORY_SHARE = 0.1
+
+
 class PiWindow(object):
 
     """Class to handle the window.
@@ -27,6 +36,9 @@ class PiWindow(object):
     :type is_fullscreen: bool
     :attr display_size: tuple (width, height) represneting the size of the screen
     :type display_size: tuple
+    :attr cache: cache of the backgrounds and foreground surfaces (its counters
+                 are useful for debugging)
+    :type cache: :py:class:`pibooth.view.cache.SurfacesCache`
     """
 
     CENTER = 'center'
@@ -64,7 +76,14 @@ class PiWindow(object):
         self.display_size = (info.current_w, info.current_h)
         self.surface = pygame.display.set_mode(self.__size, pygame.RESIZABLE)
 
-        self._buffered_images = {}
+        # Budget of 16 screens (32 bits per pixel) if enough memory is available
+        self.cache = SurfacesCache(get_memory_budget(max(self.display_size[0] * self.display_size[1],
+                                                         self.__size[0] * self.__size[1]) * 4 * 16,
+                                                     share=SURFACES_MEMORY_SHARE))
+        self._images_keys = {}  # id(image) -> (weak reference, key)
+        self._images_counter = itertools.count()
+        self._mipmaps = OrderedDict()
+        self._animation_frames = []
         self._current_background = None
         self._current_foreground = None
         self._print_number = 0
@@ -83,31 +102,49 @@ class PiWindow(object):
                         (192, 0, 224, 0, 240, 0, 248, 0, 252, 0, 254, 0, 255, 0, 255,
                          128, 255, 192, 255, 224, 254, 0, 239, 0, 207, 0, 135, 128, 7, 128, 3, 0))
 
-    def _update_foreground(self, pil_image, pos=CENTER, resize=True):
-        """Show a PIL image on the foreground.
-        Only one is bufferized to avoid memory leak.
+    def _get_image_key(self, pil_image):
+        """Return a key identifying the PIL image. Unlike its id, the key is
+        not reused after the image is destroyed.
+        """
+        ref, key = self._images_keys.get(id(pil_image), (None, None))
+        if ref is None or ref() is not pil_image:
+            image_id, key = id(pil_image), next(self._images_counter)
+            ref = weakref.ref(pil_image, lambda _: self._forget_image(image_id, key))
+            self._images_keys[image_id] = (ref, key)
+        return key
+
+    def _forget_image(self, image_id, key):
+        """Drop the surfaces of a destroyed PIL image.
         """
-        image_name = id(pil_image)
+        if self._images_keys.get(image_id, (None, None))[1] == key:
+            self._images_keys.pop(image_id)
+        self.cache.invalidate('foreground', key)
 
+    def _get_foreground_key(self, pil_image, pos=CENTER, resize=True):
+        """Return the cache key of the foreground surface and the maximum size
+        of the foreground.
+        """
         if pos == self.FULLSCREEN:
             image_size_max = (self.surface.get_size()[0] * 0.9, self.surface.get_size()[1] * 0.9)
         else:
             image_size_max = (self.surface.get_size()[0] * 0.48, self.surface.get_size()[1])
+        return ('foreground', self._get_image_key(pil_image), image_size_max, resize), image_size_max
 
-        buff_size, buff_image = self._buffered_images.get(image_name, (None, None))
-        if buff_image and image_size_max == buff_size:
-            image = buff_image
-        else:
+    def _update_foreground(self, pil_image, pos=CENTER, resize=True):
+        """Show a PIL image on the foreground.
+        """
+        key, image_size_max = self._get_foreground_key(pil_image, pos, resize)
+
+        image = self.cache.get(key)
+        if image is None:
             if resize:
-                image = pil_image.resize(sizing.new_size_keep_aspect_ratio(
-                    pil_image.size, image_size_max), Resampling.LANCZOS)
+                size = sizing.new_size_keep_aspect_ratio(pil_image.size, image_size_max)
+                image = self._get_nearest_mipmap(pil_image, size).resize(size, Resampling.LANCZOS)
             else:
                 image = pil_image
             image = pygame.image.frombuffer(image.tobytes(), image.size, image.mode)
-            if self._current_foreground:
-                self._buffered_images.pop(id(self._current_foreground[0]), None)
-            LOGGER.debug("Add to buffer the image '%s'", image_name)
-            self._buffered_images[image_name] = (image_size_max, image)
+            LOGGER.debug("Add to cache the foreground %s", key)
+            self.cache.put(key, image)
 
         self._current_foreground = (pil_image, pos, resize)
 
@@ -119,14 +156,56 @@ class PiWindow(object):
 
         return self.surface.blit(image, self._pos_map[pos](image))
 
+    def _get_nearest_mipmap(self, pil_image, size):
+        """Return the smallest version of the image (see :py:meth:`set_mipmaps`)
+        which is not smaller than the given size.
+        """
+        _, mipmaps = self._mipmaps.get(id(pil_image), (None, []))
+        for mipmap in reversed(mipmaps):
+            if mipmap.size[0] >= size[0] and mipmap.size[1] >= size[1]:
+                return mipmap
+        return pil_image
+
+    def set_mipmaps(self, pil_image, mipmaps):
+        """Register reduced versions of a PIL image, used instead of the
+        image itself to compute the displayed one. Only the ones of the two
+        last images are kept.
+
+        :param pil_image: PIL image
+        :type pil_image: :py:class:`PIL.Image`
+        :param mipmaps: reduced images from the biggest to the smallest
+        :type mipmaps: list
+        """
+        # Keep a reference on the image: its id shall not be reused
+        self._mipmaps[id(pil_image)] = (pil_image, mipmaps)
+        while len(self._mipmaps) > 2:
+            self._mipmaps.popitem(last=False)
+
+    def set_animation(self, frames):
+        """Register the PIL images displayed successively as an animation.
+        The surfaces of the previous animation frames are dropped from the
+        cache (except the currently displayed one).
+
+        :param frames: PIL images of the animation (empty to stop it)
+        :type frames: list
+        """
+        current = self._current_foreground[0] if self._current_foreground else None
+        for frame in self._animation_frames:
+            if frame is not current and not any(frame is new_frame for new_frame in frames):
+                self.cache.invalidate('foreground', self._get_image_key(frame))
+        # Keep a reference on the images while the animation is running
+        self._animation_frames = list(frames)
+
     def _update_background(self, bkgd):
         """Show image on the background.
         """
-        self._current_background = self._buffered_images.setdefault(str(bkgd), bkgd)
+        key = ('background', str(bkgd))
+        self._current_background = self.cache.get(key, bkgd)
         self._current_background.set_color(self.bg_color)
         self._current_background.set_outlines(self.debug)
         self._current_background.set_text_color(self.text_color)
         self._current_background.resize(self.surface)
+        self.cache.put(key, self._current_background)  # Surfaces may have been resized
         self._current_background.paint(self.surface)
         self._update_capture_number()
         self._update_print_number()
@@ -254,8 +333,7 @@ class PiWindow(object):
 
         if pil_image:
             self._update_foreground(pil_image, self.RIGHT)
-        elif self._current_foreground:
-            self._buffered_images.pop(id(self._current_foreground[0]), None)
+        else:
             self._current_foreground = None
 
     def show_choice(self, choices, selected=None):
@@ -273,9 +351,12 @@ class PiWindow(object):
         if not pil_image:
             # Clear the currently displayed image
             if self._current_foreground:
-                _, image = self._buffered_images.pop(id(self._current_foreground[0]))
+                key, _ = self._get_foreground_key(*self._current_foreground)
                 _, pos, _ = self._current_foreground
                 self._current_foreground = None
+                image = self.cache.pop(key)
+                if image is None:
+                    return None
                 image.fill((0, 0, 0))
                 return self.surface.blit(image, self._pos_map[pos](image))
         else:
@@ -302,8 +383,8 @@ class PiWindow(object):
         self._capture_number = (0, self._capture_number[1])
         if pil_image:
             bg = background.FinishedWithImageBackground(pil_image.size)
-            if self._buffered_images.get(str(bg), bg).foreground_size != pil_image.size:
-                self._buffered_images.pop(str(bg))  # Drop cache, foreground size ratio has changed
+            if self.cache.get(('background', str(bg)), bg).foreground_size != pil_image.size:
+                self.cache.pop(('background', str(bg)))  # Drop cache, foreground size ratio has changed
             self._update_background(background.FinishedWithImageBackground(pil_image.size))
             self._update_foreground(pil_image, self.FULLSCREEN)
         else:
@@ -383,9 +464,11 @@ class PiWindow(object):
         self.update()
 
     def drop_cache(self):
-        """Drop all cached background and foreground to force
-        refreshing the view.
+        """Drop the cached backgrounds (they depend on the configuration)
+        to force refreshing the view. The foreground surfaces only depend
+        on the images and the window size, they are kept.
         """
+        LOGGER.debug("Surfaces cache statistics: %s", self.cache.get_stats())
         self._current_background = None
         self._current_foreground = None
-        self._buffered_images = {}
+        self.cache.invalidate('background')
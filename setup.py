@@ -86,6 +86,7 @@ def main():
                                           "pibooth-diag = pibooth.scripts.diagnostic:main",
                                           "pibooth-fonts = pibooth.scripts.fonts:main",
                                           "pibooth-regen = pibooth.scripts.regenerate:main",
+                                          "pibooth-bench = pibooth.scripts.bench:main",
                                           "pibooth-printcfg = pibooth.scripts.printer:main"]},
     )
 
@@ -2,10 +2,13 @@
 
 
 import os
+import threading
 import pytest
 from PIL import Image
 from pibooth import language
 from pibooth.counters import Counters
+from pibooth.plugins import create_plugin_manager
+from pibooth.plugins.picture_plugin import PicturePlugin
 from pibooth.config.parser import PiConfigParser
 from pibooth.camera import get_rpi_camera_proxy, get_gp_camera_proxy, get_cv_camera_proxy
 from pibooth.camera import RpiCamera, GpCamera, CvCamera, HybridRpiCamera, HybridCvCamera
@@ -17,6 +20,49 @@ MOCKS_DIR = os.path.join(os.path.dirname(__file__), 'mocks')
 CAPTURES_DIR = os.path.join(os.path.dirname(__file__), 'captures')
 
 
+class DummyCamera(object):
+
+    """Camera giving the captures once its event is set.
+    """
+
+    resolution = (600, 400)
+
+    def __init__(self, captures):
+        self.captures = captures
+        self.event = threading.Event()
+
+    def get_capture(self, index):
+        self.event.wait(10)
+        return self.captures[index]
+
+    def get_captures(self, raw=False):
+        self.event.wait(10)
+        return [(capture, None) for capture in self.captures]
+
+
+class DummyPrinter(object):
+
+    profile = ((4, 6), 600)
+
+    def get_profile(self):
+        return self.profile
+
+
+class DummyApp(object):
+
+    def __init__(self, camera, counters):
+        self.camera = camera
+        self.printer = DummyPrinter()
+        self.count = counters
+        self.capture_nbr = len(camera.captures)
+        self.capture_choices = (len(camera.captures), 4)
+        self.capture_date = '2021-01-01-12-00-00'
+        self.picture_filename = 'picture.jpg'
+        self.previous_picture = None
+        self.previous_animated = None
+        self.previous_picture_file = None
+
+
 @pytest.fixture
 def init(tmpdir):
     return language.init(str(tmpdir.join('translations.cfg')))
@@ -70,6 +116,32 @@ def counters(tmpdir):
     return Counters(str(tmpdir.join('data.pickle')), nbr_printed=0)
 
 
+@pytest.fixture
+def plugin_manager():
+    pm = create_plugin_manager()
+    pm.register(PicturePlugin(pm), name=PicturePlugin.name)
+    yield pm
+    pm.hook.pibooth_cleanup(app=None)
+
+
+@pytest.fixture
+def config(plugin_manager, cfg_path, tmpdir):
+    cfg = PiConfigParser(cfg_path, plugin_manager)
+    cfg.set('GENERAL', 'directory', str(tmpdir))
+    cfg.set('WINDOW', 'animate', 'False')
+    cfg.set('PICTURE', 'backgrounds', '(255, 255, 255)')
+    return cfg
+
+
+@pytest.fixture
+def make_app(counters):
+    """Return a function building an application taking the given captures.
+    """
+    def build(captures):
+        return DummyApp(DummyCamera(captures), counters)
+    return build
+
+
 @pytest.fixture(scope='session')
 def proxy_rpi():
     return get_rpi_camera_proxy()
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+import os.path as osp
+import pytest
+from pibooth.pictures.factory import PilPictureFactory, OpenCvPictureFactory
+from pibooth.scripts import bench
+
+
+@pytest.mark.parametrize('factory_class', [PilPictureFactory, OpenCvPictureFactory])
+@pytest.mark.parametrize('variant', bench.VARIANTS)
+def test_bench_factory(factory_class, variant, fond_path, tmpdir):
+    captures, overlay = bench.load_captures(osp.join(osp.dirname(__file__), 'captures'), 'portrait', 4)
+    assert len(captures) == 4
+    result = bench.bench_factory(factory_class, captures, (1200, 1800), variant, fond_path, overlay,
+                                 str(tmpdir.join('picture.jpg')), repeat=1)
+    assert list(result['stages']) == list(bench.STAGES)
+    assert result['total'] == sum(result['stages'].values())
+    assert result['tracemalloc_peak'] > 0
+    assert result['peak_rss'] is None or result['peak_rss'] > 0
+    assert tmpdir.join('picture.jpg').check()
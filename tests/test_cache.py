@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from PIL import Image
+from pibooth.pictures import factory
+from pibooth.pictures.cache import ImagesCache, CACHE, get_budget
+
+
+def loader(size):
+    calls = []
+
+    def load():
+        calls.append(size)
+        return Image.new('RGB', size)
+    return load, calls
+
+
+def test_cache_hit(fond_path):
+    cache = ImagesCache(10 * 1024 * 1024)
+    load, calls = loader((100, 100))
+    image1 = cache.get(fond_path, (100, 100), True, 'pil', load)
+    image2 = cache.get(fond_path, (100, 100), True, 'pil', load)
+    assert image1 is image2
+    assert len(calls) == 1
+    assert cache.nbytes == 100 * 100 * 4  # PIL stores RGB on 4 bytes
+
+
+def test_cache_key(fond_path):
+    cache = ImagesCache(10 * 1024 * 1024)
+    load, calls = loader((100, 100))
+    cache.get(fond_path, (100, 100), True, 'pil', load)
+    cache.get(fond_path, (100, 100), False, 'pil', load)
+    cache.get(fond_path, (100, 100), True, 'opencv', load)
+    cache.get(fond_path, (200, 100), True, 'pil', load)
+    assert len(calls) == 4
+    assert len(cache) == 4
+
+
+def test_cache_lru_eviction(fond_path, overlays_landscape_path):
+    cache = ImagesCache(2 * 100 * 100 * 4)
+    load, calls = loader((100, 100))
+    cache.get(fond_path, (100, 100), True, 'pil', load)
+    cache.get(overlays_landscape_path[0], (100, 100), True, 'pil', load)
+    cache.get(fond_path, (100, 100), True, 'pil', load)  # Most recently used
+    cache.get(overlays_landscape_path[1], (100, 100), True, 'pil', load)
+    assert len(cache) == 2
+    assert cache.nbytes <= cache.max_bytes
+    cache.get(fond_path, (100, 100), True, 'pil', load)
+    assert len(calls) == 3
+
+
+def test_cache_too_big(fond_path):
+    cache = ImagesCache(100)
+    load, calls = loader((100, 100))
+    cache.get(fond_path, (100, 100), True, 'pil', load)
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+@pytest.mark.parametrize('factory_class', [factory.PilPictureFactory, factory.OpenCvPictureFactory])
+@pytest.mark.parametrize('overlay', [False, True])
+def test_cache_budget(factory_class, overlay, captures_landscape, fond_path, overlays_landscape_path):
+    if factory_class is factory.OpenCvPictureFactory and not factory.cv2:
+        pytest.skip("OpenCV is not installed")
+    max_bytes = CACHE.max_bytes
+    CACHE.clear()
+    CACHE.set_max_bytes(get_budget(1200, 1800, layouts=1))
+    try:
+        picture = factory_class(1200, 1800, *captures_landscape[:2])
+        picture.set_background(fond_path)
+        picture.add_text('Footer', 'Amatic-Bold', (0, 0, 0))
+        if overlay:
+            picture.set_overlay(overlays_landscape_path[0])
+        picture.build()
+        assert len(CACHE) == 2  # Nothing evicted
+    finally:
+        CACHE.clear()
+        CACHE.set_max_bytes(max_bytes)
+
+
+def test_memory_budget(monkeypatch):
+    from collections import namedtuple
+    from pibooth.pictures import cache
+    memory = namedtuple('memory', 'available')
+    monkeypatch.setattr(cache.psutil, 'virtual_memory', lambda: memory(800 * 1024 * 1024))
+    assert cache.get_memory_budget(10 * 1024 * 1024) == 10 * 1024 * 1024
+    # Quarter of the available memory shared by the main process and 4 workers
+    assert cache.get_memory_budget(get_budget(2400, 3600), 5) == 40 * 1024 * 1024
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import threading
 import pytest
+from PIL import Image
+from pibooth.camera.base import BaseCamera
 
 
 @pytest.mark.skipif("CAM_VIDEODRIVER" in os.environ, reason="No camera")
@@ -32,3 +36,95 @@ def test_hybridr_capture(camera_rpi_gp):
 def test_hybridc_capture(camera_cv_gp):
     camera_cv_gp.capture()
     assert camera_cv_gp.get_captures()
+
+
+class DummyCamera(BaseCamera):
+
+    def __init__(self):
+        super(DummyCamera, self).__init__(None)
+        self.retrieved = []
+        self.threads = []
+
+    def _retrieve_capture(self, capture_data):
+        self.retrieved.append(capture_data)
+
+    def _post_process_capture(self, capture_data):
+        self.threads.append(threading.current_thread())
+        return Image.new('RGB', (10, 10), capture_data)
+
+    def _get_raw_capture(self, capture_data):
+        return capture_data.encode() if capture_data != 'blue' else None
+
+
+def test_raw_captures():
+    camera = DummyCamera()
+    camera._captures.extend(['red', 'blue'])
+    captures = camera.get_captures(raw=True)
+    assert [(image.getpixel((0, 0)), data) for image, data in captures] == [((255, 0, 0), b'red'),
+                                                                          ((0, 0, 255), None)]
+    assert not camera._captures
+
+
+def test_post_process_async():
+    camera = DummyCamera()
+    camera._captures.append('red')
+    camera.post_process_async()
+    camera._captures.append('blue')
+    camera.post_process_async()
+    camera._captures.append('green')
+    assert camera.retrieved == ['red', 'blue']
+
+    images = camera.get_captures()
+    assert [image.getpixel((0, 0)) for image in images] == [(255, 0, 0), (0, 0, 255), (0, 128, 0)]
+    assert all(thread is not threading.current_thread() for thread in camera.threads[:2])
+    assert camera.threads[2] is threading.current_thread()
+    assert not camera._processing
+
+
+class GpPath(object):
+
+    folder = '/store'
+    name = 'capt0001.jpg'
+
+
+def test_gp_rotated_capture_exif():
+    from pibooth.camera.gphoto import GpCamera
+    from pibooth.pictures import get_best_orientation, PORTRAIT
+    from pibooth.pictures.factory import PilPictureFactory
+    from pibooth.pictures.exif import ORIENTATION_TAG
+    data = io.BytesIO()
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    Image.new('RGB', (300, 200)).save(data, 'JPEG', exif=exif)
+
+    camera = GpCamera(None)
+    camera.resolution = (200, 300)
+    camera.capture_rotation = 90
+    camera._downloads[(GpPath.folder, GpPath.name)] = data.getvalue()
+    capture = camera._post_process_capture((GpPath(), 'none'))
+    assert capture.size == (200, 300)
+    assert capture.getexif().get(ORIENTATION_TAG) == 6  # Pixels already rotated
+
+    assert get_best_orientation([capture]) == PORTRAIT
+    factory = PilPictureFactory(400, 600, capture)
+    assert factory._draft_image(0, capture).size == (200, 300)
+
+
+def test_gp_capture_dropped_while_processing():
+    from pibooth.camera.gphoto import GpCamera
+    data = io.BytesIO()
+    Image.new('RGB', (300, 200)).save(data, 'JPEG')
+
+    camera = GpCamera(None)
+    camera.resolution = (300, 200)
+    camera._downloads[(GpPath.folder, GpPath.name)] = data.getvalue()
+    download = camera._download_capture
+
+    def download_and_drop(gp_path):
+        result = download(gp_path)
+        camera._downloads.clear()  # drop_captures() called by the main thread
+        return result
+
+    camera._download_capture = download_and_drop
+    capture = camera._post_process_capture((GpPath(), 'none'))
+    assert capture.size == (300, 200)
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import os
+import pickle
 import pytest
+from pibooth.counters import Counters, RECORD, FLAG_BATCH, pack_record
 
 
 def test_iter(counters):
@@ -44,3 +47,94 @@ def test_save(counters):
     counters.reset()
     counters.load()
     assert counters.nbr_printed == 0
+
+
+def test_journal(counters):
+    counters.nbr_printed = 3
+    counters.nbr_printed += 1
+    assert os.path.getsize(counters.journal) == 2 * RECORD.size
+    assert Counters(counters.filename, nbr_printed=0).nbr_printed == 4
+
+
+def test_journal_interrupted_write(counters):
+    counters.nbr_printed = 3
+    with open(counters.journal, 'ab') as fp:
+        fp.write(pack_record('nbr_printed', 8, 100)[:20])  # Power cut
+    assert Counters(counters.filename, nbr_printed=0).nbr_printed == 3
+
+
+def test_journal_compaction(tmpdir):
+    counters = Counters(str(tmpdir.join('data.pickle')), max_records=3, nbr_printed=0)
+    for _ in range(4):
+        counters.nbr_printed += 1
+    assert os.path.getsize(counters.journal) == RECORD.size
+    os.remove(counters.journal)
+    assert Counters(counters.filename, nbr_printed=0).nbr_printed == 3
+
+
+def test_transaction(tmpdir):
+    counters = Counters(str(tmpdir.join('data.pickle')), taken=0, printed=0)
+    with counters.transaction():
+        counters.taken += 1
+        counters.printed += 1
+        assert not os.path.isfile(counters.journal)  # Nothing written yet
+    assert os.path.getsize(counters.journal) == 2 * RECORD.size
+
+    # Incomplete transaction is ignored
+    with open(counters.journal, 'ab') as fp:
+        fp.write(pack_record('taken', 5, 10, FLAG_BATCH))
+    reader = Counters(counters.filename, taken=0, printed=0)
+    assert (reader.taken, reader.printed) == (1, 1)
+
+
+def test_transaction_error(counters):
+    with pytest.raises(ZeroDivisionError):
+        with counters.transaction():
+            counters.nbr_printed = 5
+            1 / 0
+    assert counters.nbr_printed == 0
+    assert Counters(counters.filename, nbr_printed=0).nbr_printed == 0
+
+
+def test_load_old_format(tmpdir):
+    with open(str(tmpdir.join('data.pickle')), 'wb') as fp:
+        pickle.dump({'nbr_printed': 7}, fp)
+    counters = Counters(str(tmpdir.join('data.pickle')), nbr_printed=0)
+    assert counters.nbr_printed == 7
+    counters.nbr_printed += 1
+    assert Counters(counters.filename, nbr_printed=0).nbr_printed == 8
+
+
+def test_several_writers(tmpdir):
+    writer1 = Counters(str(tmpdir.join('data.pickle')), max_records=3, taken=0, printed=0)
+    writer2 = Counters(writer1.filename, max_records=3, taken=0, printed=0)
+    writer1.taken += 1
+    writer2.printed += 1  # Journal replaced (first write)
+    writer1.taken += 1
+    for _ in range(3):
+        writer2.printed += 1  # Journal compacted
+    writer1.taken += 1
+    assert (writer1.taken, writer1.printed) == (3, 4)
+    reader = Counters(writer1.filename, taken=0, printed=0)
+    assert (reader.taken, reader.printed) == (3, 4)
+
+
+def test_several_writers_increments(tmpdir):
+    writer1 = Counters(str(tmpdir.join('data.pickle')), taken=0, printed=0)
+    writer2 = Counters(writer1.filename, taken=0, printed=0)
+    writer1.taken += 1
+    writer2.taken += 1  # Computed from a stale value, increment re-applied
+    assert writer2.taken == 2
+    with writer1.transaction():
+        writer1.taken += 2
+        writer1.printed += 1
+    assert (writer1.taken, writer1.printed) == (4, 1)
+    reader = Counters(writer1.filename, taken=0, printed=0)
+    assert (reader.taken, reader.printed) == (4, 1)
+
+
+def test_snapshot_format(counters):
+    counters.nbr_printed = 5
+    counters.save()
+    with open(counters.filename, 'rb') as fp:
+        assert pickle.load(fp) == {'nbr_printed': 5}  # Readable by previous versions
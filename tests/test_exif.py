@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import io
+import pytest
+from PIL import Image, ImageOps, ImageChops
+from pibooth.pictures.exif import ORIENTATION_TAG, get_orientation, set_jpeg_orientation
+
+ROTATIONS = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+
+@pytest.fixture(scope='module')
+def jpeg_data(captures_landscape):
+    data = io.BytesIO()
+    captures_landscape[0].resize((120, 80)).save(data, 'JPEG')
+    return data.getvalue()
+
+
+@pytest.mark.parametrize('rotation', [0, 90, 180, 270])
+@pytest.mark.parametrize('flip', [False, True])
+def test_orientation(jpeg_data, rotation, flip):
+    expected = Image.open(io.BytesIO(jpeg_data))
+    if rotation:
+        expected = expected.transpose(ROTATIONS[rotation])
+    if flip:
+        expected = expected.transpose(Image.FLIP_LEFT_RIGHT)
+
+    data = set_jpeg_orientation(jpeg_data, get_orientation(rotation, flip))
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    assert image.size == expected.size
+    assert not ImageChops.difference(image.convert('RGB'), expected.convert('RGB')).getbbox()
+
+
+def test_orientation_update(jpeg_data):
+    data = set_jpeg_orientation(jpeg_data, 6)
+    assert Image.open(io.BytesIO(data)).getexif()[ORIENTATION_TAG] == 6
+    new_data = set_jpeg_orientation(data, 3)
+    assert len(new_data) == len(data)
+    assert Image.open(io.BytesIO(new_data)).getexif()[ORIENTATION_TAG] == 3
+
+
+def test_orientation_unchanged(jpeg_data):
+    assert set_jpeg_orientation(jpeg_data, 1) is jpeg_data
+
+
+def test_orientation_no_tag(jpeg_data):
+    exif = Image.Exif()
+    exif[0x010f] = 'pibooth'  # Make
+    data = io.BytesIO()
+    Image.open(io.BytesIO(jpeg_data)).save(data, 'JPEG', exif=exif)
+    assert set_jpeg_orientation(data.getvalue(), 1) == data.getvalue()
+    assert set_jpeg_orientation(data.getvalue(), 6) is None
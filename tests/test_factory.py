@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import sys
+import subprocess
+import os.path as osp
+from concurrent.futures import ThreadPoolExecutor
 import pytest
-from pibooth.pictures.factory import PilPictureFactory, OpenCvPictureFactory
+from PIL import ImageChops
+import pibooth
+from pibooth.pictures.cache import CACHE
+from pibooth.pictures.factory import PilPictureFactory, OpenCvPictureFactory, AlphaOverlay
 
 footer_texts = ('This is the main title', 'Footer text 2', 'Footer text 3')
 footer_fonts = ('Amatic-Bold', 'DancingScript-Regular', 'Roboto-LightItalic')
@@ -79,3 +86,126 @@ def test_save_cv2_overlay_landscape(captures_nbr, captures_landscape, fond_path,
     setup_factory(factory, fond_path, overlays_landscape_path[captures_nbr - 1])
     path = tmpdir.join("OpenCV-landscape-overlay-{}.jpg".format(captures_nbr))
     factory.save(str(path))
+
+
+@pytest.mark.parametrize('factory_class', [PilPictureFactory, OpenCvPictureFactory])
+def test_template_reused(factory_class, captures_landscape, fond_path, overlays_landscape_path):
+    factory1 = factory_class(3600, 2400, *captures_landscape[:2])
+    setup_factory(factory1, fond_path, overlays_landscape_path[1])
+    factory2 = factory_class(3600, 2400, *reversed(captures_landscape[:2]))
+    setup_factory(factory2, fond_path, overlays_landscape_path[1])
+    assert factory1._get_template() is factory2._get_template()
+    assert factory1.build().size == factory2.build().size == (3600, 2400)
+
+
+@pytest.mark.parametrize('factory_class', [PilPictureFactory, OpenCvPictureFactory])
+def test_template_memory(factory_class, captures_landscape, fond_path, overlays_landscape_path):
+    CACHE.clear()
+    factory = factory_class(1800, 1200, *captures_landscape[:2])
+    setup_factory(factory, fond_path)
+    factory.build()
+    template = factory._get_template()
+    assert not template.texts
+    assert all(isinstance(value, (tuple, list)) for value in vars(template).values())
+    assert len(CACHE) == 2  # Background, and background with texts
+    assert CACHE.nbytes <= CACHE.max_bytes
+
+
+def test_template_threads(captures_landscape, fond_path):
+    factories = [PilPictureFactory(1800, 1200, *captures_landscape[:2]) for _ in range(4)]
+    for factory in factories:
+        setup_factory(factory, fond_path)
+    with ThreadPoolExecutor(4) as executor:
+        templates = list(executor.map(lambda factory: factory._get_template(), factories))
+    assert all(template is templates[0] for template in templates)
+
+
+def test_template_invalidated(captures_landscape, fond_path):
+    factory = PilPictureFactory(3600, 2400, *captures_landscape[:2])
+    setup_factory(factory, fond_path)
+    template = factory._get_template()
+    factory.set_margin(50)
+    assert factory._get_template() is not template
+
+
+def test_alpha_overlay_compose():
+    np = pytest.importorskip('numpy')
+    rng = np.random.RandomState(0)
+    overlay = rng.randint(0, 256, (300, 500, 4)).astype(np.uint8)
+    overlay[:100, :, 3] = 0  # Transparent band
+    overlay[100:200, :250, 3] = 255  # Opaque area
+    image = rng.randint(0, 256, (300, 500, 3)).astype(np.uint8)
+
+    mask = overlay[..., 3:] / 255.0
+    expected = (1.0 - mask) * image + mask * overlay[..., :3]
+
+    alpha = AlphaOverlay(overlay, 64)
+    assert all(region[1] >= 64 for region in alpha.regions)
+    alpha.compose(image)
+    assert np.abs(image - expected).max() <= 0.5 + 1e-6
+
+
+@pytest.mark.parametrize('factory_class', [PilPictureFactory, OpenCvPictureFactory])
+def test_progressive_build(factory_class, captures_landscape, fond_path, overlays_landscape_path):
+    captures = [capture.resize((600, 400)) for capture in captures_landscape[:3]]
+    factory = factory_class(1800, 1200, *captures)
+    setup_factory(factory, fond_path, overlays_landscape_path[2])
+    expected = factory.build()
+
+    factory = factory_class(1800, 1200, *captures)
+    setup_factory(factory, fond_path, overlays_landscape_path[2])
+    factory.begin(3)
+    for index in (2, 0):
+        factory.add_capture(index, captures[index])
+    with pytest.raises(ValueError):
+        factory.finalize()
+    factory.add_capture(1, captures[1])
+    assert factory.build().tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('crop', [False, True])
+def test_memory_limit_build(crop, captures_landscape, fond_path, overlays_landscape_path):
+    captures = [capture.resize((600, 400)) for capture in captures_landscape[:3]]
+    factory = PilPictureFactory(1800, 1200, *captures)
+    setup_factory(factory, fond_path, overlays_landscape_path[2])
+    factory.set_cropping(crop)
+    expected = factory.build()
+
+    factory.set_memory_limit(64 * 1024)
+    assert list(factory._iter_bands(1800, 10, 4)) == [(0, 9), (9, 10)]
+    image = factory.build()
+    assert image.size == expected.size
+    diff = ImageChops.difference(image, expected).getextrema()
+    assert max(high for _, high in diff) <= 2
+
+
+PEAK_SCRIPT = """
+import resource
+from PIL import Image
+from pibooth.pictures.factory import PilPictureFactory
+captures = [Image.open(path) for path in {captures!r}]
+for capture in captures:
+    capture.load()
+factory = PilPictureFactory(2400, 3600, *captures)
+factory.add_text('Footer', 'Amatic-Bold', (0, 0, 0))
+factory.set_background({background!r})
+factory.set_overlay({overlay!r})
+factory.set_memory_limit({limit})
+factory._get_template()
+start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+factory.build()
+print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start) * 1024)
+"""
+
+
+def test_memory_limit_peak(captures_portrait, fond_path, overlays_portrait_path):
+    pytest.importorskip('resource')
+    limit = 8 * 1024 * 1024
+    script = PEAK_SCRIPT.format(captures=[capture.filename for capture in captures_portrait[:2]],
+                                background=fond_path, overlay=sorted(overlays_portrait_path)[-1], limit=limit)
+    # Measured in a new process, the peak of this one depends on other tests
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=osp.dirname(osp.dirname(pibooth.__file__)))
+    peak = int(output.split()[-1])
+    # Final picture (PIL uses 4 bytes per pixel for RGB) and a few bands
+    assert peak < 2400 * 3600 * 4 + 4 * limit
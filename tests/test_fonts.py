@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import os.path as osp
+from pibooth import fonts
+
+
+def test_pil_font_memoized(tmpdir):
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    font1 = fonts.get_pil_font('Hello', font_path, 400, 100)
+    assert len(fonts.INDEX) == 1
+    font2 = fonts.get_pil_font('Hello', font_path, 400.9, 100.2)
+    assert font1 is font2
+    assert len(fonts.INDEX) == 1
+
+
+def test_pil_font_fit(tmpdir):
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    font = fonts.get_pil_font('Hello', font_path, 400, 100)
+    smaller = fonts._get_face('pil', font_path, font.size - 1)
+    bbox = smaller.getbbox('Hello')
+    assert bbox[2] - bbox[0] <= 400 and bbox[3] - bbox[1] <= 100
+    bbox = font.getbbox('Hello')
+    assert bbox[2] - bbox[0] > 400 or bbox[3] - bbox[1] > 100
+
+
+def test_probed_faces_not_cached(tmpdir):
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    fonts._FACES.clear()
+    font_path = fonts.get_filename('Amatic-Bold')
+    font = fonts.get_pil_font('Hello', font_path, 400, 100)
+    assert list(fonts._FACES) == [('pil', font_path, font.size)]
+
+
+def test_index_persistent(tmpdir):
+    filename = osp.join(str(tmpdir), 'fonts.json')
+    fonts.init(filename, clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    fonts.get_pil_font('Hello', font_path, 400, 100)
+    assert not osp.isfile(filename)  # Saving delayed
+    fonts.save()
+    assert osp.isfile(filename)
+    index = dict(fonts.INDEX)
+
+    fonts.init(filename)
+    assert fonts.INDEX == index
+
+    fonts.init(filename, clear=True)
+    assert not fonts.INDEX
+
+
+def test_index_max_entries(tmpdir, monkeypatch):
+    monkeypatch.setattr(fonts, 'INDEX_MAX_ENTRIES', 2)
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    for text in ('a', 'b', 'c'):
+        fonts.get_pil_font(text, font_path, 400, 100)
+    assert len(fonts.INDEX) == 2
+    assert not any(key.endswith('|a') for key in fonts.INDEX)
+
+
+def test_index_lru(tmpdir, monkeypatch):
+    monkeypatch.setattr(fonts, 'INDEX_MAX_ENTRIES', 2)
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    for text in ('a', 'b', 'a', 'c'):
+        fonts.get_pil_font(text, font_path, 400, 100)
+    assert [key[-1] for key in fonts.INDEX] == ['a', 'c']
+
+
+def test_index_threads(tmpdir):
+    fonts.init(osp.join(str(tmpdir), 'fonts.json'), clear=True)
+    font_path = fonts.get_filename('Amatic-Bold')
+    texts = ['text{}'.format(i) for i in range(20)]
+    threads = [threading.Thread(target=lambda: [fonts.get_pil_font(text, font_path, 400, 100) for text in texts])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fonts.INDEX) == 20
+    fonts.save()
+    with open(osp.join(str(tmpdir), 'fonts.json')) as fp:
+        assert len(json.load(fp)) == 20
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path as osp
+import pytest
+from PIL import Image
+from pibooth.pictures.output import save_image, write_bytes, get_format
+
+
+def test_get_format():
+    assert get_format('a/b/picture.jpg') == 'JPEG'
+    assert get_format('picture.PNG') == 'PNG'
+    with pytest.raises(ValueError):
+        get_format('picture.unknown')
+
+
+def test_write_bytes_hard_links(tmpdir):
+    paths = [str(tmpdir.join('a.bin')), str(tmpdir.mkdir('sub').join('b.bin'))]
+    write_bytes(b'data', *paths)
+    for path in paths:
+        with open(path, 'rb') as fp:
+            assert fp.read() == b'data'
+    assert os.stat(paths[0]).st_ino == os.stat(paths[1]).st_ino
+    assert sorted(os.listdir(str(tmpdir))) == ['a.bin', 'sub']
+
+
+def test_write_bytes_replace(tmpdir):
+    path = str(tmpdir.join('a.bin'))
+    write_bytes(b'old', path)
+    write_bytes(b'new', path)
+    with open(path, 'rb') as fp:
+        assert fp.read() == b'new'
+
+
+def test_write_bytes_no_link(tmpdir, monkeypatch):
+    def link(src, dst):
+        raise OSError("Not supported")
+    monkeypatch.setattr(os, 'link', link)
+    paths = [str(tmpdir.join('a.bin')), str(tmpdir.join('b.bin')), str(tmpdir.join('c.bin'))]
+    write_bytes(b'data', *paths)
+    assert len(set(os.stat(path).st_ino for path in paths)) == 3
+
+
+def test_save_image_identical(tmpdir):
+    image = Image.new('RGB', (200, 100), (100, 20, 30))
+    image.save(str(tmpdir.join('reference.jpg')))
+    paths = [str(tmpdir.join('a.jpg')), str(tmpdir.join('b.jpg'))]
+    save_image(image, *paths)
+    with open(str(tmpdir.join('reference.jpg')), 'rb') as fp:
+        reference = fp.read()
+    for path in paths:
+        assert osp.getsize(path) == len(reference)
+        with open(path, 'rb') as fp:
+            assert fp.read() == reference
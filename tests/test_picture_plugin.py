@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import os.path as osp
+import threading
+import pytest
+import pibooth
+from pibooth.plugins.picture_plugin import PicturePlugin
+
+
+def process(pm, cfg, app):
+    pm.hook.state_processing_do(cfg=cfg, app=app, win=None, events=[])
+    return pm.hook.state_processing_validate(cfg=cfg, app=app, win=None, events=[])
+
+
+def test_processing_not_blocking(plugin_manager, config, captures_landscape, make_app, tmpdir):
+    app = make_app(captures_landscape[:2])
+    plugin_manager.hook.state_processing_enter(cfg=config, app=app, win=None)
+
+    for _ in range(5):  # Camera still busy
+        assert process(plugin_manager, config, app) is None
+    assert app.previous_picture is None
+
+    app.camera.event.set()
+    for _ in range(500):
+        if process(plugin_manager, config, app) is not None or app.previous_picture:
+            break
+        threading.Event().wait(0.02)
+
+    assert sorted(app.previous_picture.size) == [2400, 3600]
+    assert app.previous_picture_file == osp.join(str(tmpdir), 'picture.jpg')
+    assert osp.isfile(app.previous_picture_file)
+    assert osp.isfile(osp.join(str(tmpdir), 'raw', app.capture_date, 'pibooth001.jpg'))
+
+
+def test_processing_error(plugin_manager, config, make_app):
+    app = make_app([])
+    app.camera.get_captures = lambda raw=False: 1 / 0
+    plugin_manager.hook.state_processing_enter(cfg=config, app=app, win=None)
+    with pytest.raises(ZeroDivisionError):
+        for _ in range(500):
+            process(plugin_manager, config, app)
+            threading.Event().wait(0.02)
+
+
+class SetupRecorder(object):
+
+    def __init__(self):
+        self.calls = []
+
+    @pibooth.hookimpl
+    def pibooth_setup_picture_factory(self, cfg, opt_index, factory):
+        self.calls.append((threading.current_thread(), list(factory._images)))
+
+
+def test_processing_progressive(plugin_manager, config, captures_landscape, make_app):
+    app = make_app(captures_landscape[:2])
+    plugin = plugin_manager.get_plugin(PicturePlugin.name)
+    recorder = SetupRecorder()
+    plugin_manager.register(recorder)
+    for _ in app.camera.captures:
+        plugin_manager.hook.state_capture_exit(cfg=config, app=app, win=None)
+    factory = plugin.progressive_factory
+    assert factory and len(plugin.progressive_jobs) == 2
+    # Hook called once from the main thread, captures not available yet
+    assert recorder.calls == [(threading.main_thread(), [None, None])]
+
+    app.camera.event.set()
+    plugin_manager.hook.state_processing_enter(cfg=config, app=app, win=None)
+    for _ in range(500):
+        if process(plugin_manager, config, app) is not None:
+            break
+        threading.Event().wait(0.02)
+
+    assert app.previous_picture is factory._final
+    assert not plugin.progressive_jobs
+
+
+def test_processing_printer_profile(plugin_manager, config, captures_landscape, make_app):
+    app = make_app(captures_landscape[:2])
+    app.printer.profile = ((3.75, 5.75), 300)
+    app.camera.event.set()
+    plugin_manager.hook.state_processing_enter(cfg=config, app=app, win=None)
+    for _ in range(500):
+        if process(plugin_manager, config, app) is not None:
+            break
+        threading.Event().wait(0.02)
+
+    assert sorted(app.previous_picture.size) == [1125, 1725]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import io
+import pytest
+from PIL import Image
+from pibooth.pictures import open_image, draft_image, build_mipmaps
+
+
+@pytest.fixture(scope='module')
+def jpeg_data():
+    data = io.BytesIO()
+    Image.new('RGB', (6000, 4000), (10, 200, 30)).save(data, 'JPEG')
+    return data.getvalue()
+
+
+@pytest.mark.parametrize('size,expected', [(None, (6000, 4000)),
+                                           ((6000, 4000), (6000, 4000)),
+                                           ((3001, 2000), (6000, 4000)),
+                                           ((3000, 2000), (3000, 2000)),
+                                           ((1500, 1000), (1500, 1000)),
+                                           ((1000, 1000), (1500, 1000)),
+                                           ((1000, 100), (1500, 1000)),
+                                           ((100, 100), (750, 500))])
+def test_open_image_size(jpeg_data, size, expected):
+    image = open_image(io.BytesIO(jpeg_data), size)
+    assert image.size == expected
+    image.load()
+    assert image.size == expected
+    assert image.mode == 'RGB'
+
+
+def test_draft_not_jpeg():
+    data = io.BytesIO()
+    Image.new('RGB', (600, 400)).save(data, 'PNG')
+    image = open_image(data, (100, 100))
+    assert image.size == (600, 400)
+
+
+def test_draft_loaded_image(jpeg_data):
+    image = Image.open(io.BytesIO(jpeg_data))
+    image.load()
+    assert draft_image(image, (100, 100)).size == (6000, 4000)
+
+
+def test_factory_decode_scale(jpeg_data, tmpdir):
+    from pibooth.pictures.factory import PilPictureFactory
+    tmpdir.join('capture.jpg').write_binary(jpeg_data)
+    captures = [open_image(str(tmpdir.join('capture.jpg'))) for _ in range(4)]
+    factory = PilPictureFactory(1800, 1200, *captures)
+    assert factory._draft_image(0, captures[0]).size == (750, 500)
+    assert factory.build().size == (1800, 1200)
+    # Captures of the caller are not modified (may be used for bigger pictures)
+    assert all(capture.size == (6000, 4000) for capture in captures)
+    factory = PilPictureFactory(7200, 4800, *captures[:1])
+    assert factory._draft_image(0, captures[0]).size == (6000, 4000)
+
+
+def test_get_oriented_size(jpeg_data, tmpdir):
+    from pibooth.pictures import get_oriented_size
+    from pibooth.pictures.exif import set_jpeg_orientation
+    tmpdir.join('capture.jpg').write_binary(set_jpeg_orientation(jpeg_data, 6))
+    image = open_image(str(tmpdir.join('capture.jpg')))
+    assert get_oriented_size(image) == (4000, 6000)
+    assert image.size == (6000, 4000)
+    # Image in memory: pixels already oriented
+    assert get_oriented_size(open_image(io.BytesIO(set_jpeg_orientation(jpeg_data, 6)))) == (6000, 4000)
+
+
+def test_scale_margins():
+    from pibooth.pictures import get_picture_factory, scale_margins
+    captures = [Image.new('RGB', (600, 400))]
+    factory = get_picture_factory(captures, dpi=200, force_pil=True)
+    factory.set_margin(100, 60)
+    scale_margins(factory, 200)
+    assert (factory._margin, factory._margin_text) == (33, 20)
+
+
+def test_get_size_orientation():
+    from pibooth.pictures import get_size_orientation, PORTRAIT, LANDSCAPE
+    assert get_size_orientation((600, 400), 1) == LANDSCAPE
+    assert get_size_orientation((600, 400), 2) == PORTRAIT
+    assert get_size_orientation((400, 600), 3) == LANDSCAPE
+    assert get_size_orientation((400, 600), 4) == PORTRAIT
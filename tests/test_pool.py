@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+from multiprocessing import shared_memory
+import pytest
+from pibooth.pictures.pool import PicturesFactoryPool, SharedImage
+from pibooth.pictures.factory import PilPictureFactory
+
+
+def test_pool_reused(captures_landscape):
+    pool = PicturesFactoryPool()
+    pool.start(2, 1)
+    workers = pool._pool
+    try:
+        for _ in range(2):  # Two sessions
+            for capture in captures_landscape[:2]:
+                pool.add(PilPictureFactory(600, 400, capture.resize((300, 200))))
+            assert [image.size for image in pool.get()] == [(600, 400), (600, 400)]
+            pool.clear()
+        pool.start()
+        assert pool._pool is workers
+    finally:
+        pool.quit()
+    assert pool._pool is None
+
+
+def test_shared_image(captures_landscape):
+    image = captures_landscape[0].resize((300, 200))
+    handle = SharedImage(image)
+    try:
+        clone = pickle.loads(pickle.dumps(handle))
+        assert len(pickle.dumps(handle)) < 1000
+        shared = clone.open()
+        assert shared.size == image.size
+        assert (shared.mode, shared.readonly) == ('RGBX', 1)  # Mapped without copy
+        assert shared.convert('RGB').tobytes() == image.tobytes()
+        del shared
+        clone.close()
+    finally:
+        handle.unlink()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle.name)
+
+
+def test_pool_releases_shared_images(captures_landscape):
+    pool = PicturesFactoryPool()
+    capture = captures_landscape[0].resize((300, 200))
+    try:
+        pool.add(PilPictureFactory(600, 400, capture))
+        pool.add(PilPictureFactory(600, 400, capture, capture))
+        assert len(pool._shared) == 1  # Same capture shared once
+        names = [handle.name for _, handle in pool._shared.values()]
+        assert len(pool.get()) == 2
+        assert not pool._shared
+        for name in names:
+            with pytest.raises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+    finally:
+        pool.quit()
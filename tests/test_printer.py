@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import time
+import os.path as osp
+import threading
+import pytest
+import pygame
+from pibooth import printer
+from PIL import Image
+from pibooth.printer import Printer, PRINTER_TASKS_UPDATED
+
+
+class FakeConnection(object):
+
+    """CUPS connection recording the printed files.
+    """
+
+    printed = []
+    paths = []
+    jobs = {}
+    attributes = {}
+    ppd = None
+    lock = threading.Event()
+
+    def getDefault(self):
+        return 'Fake'
+
+    def getPrinters(self):
+        return {'Fake': {}}
+
+    def printFile(self, name, filename, title, options):
+        self.lock.wait(10)
+        if filename.endswith('error.jpg'):
+            raise IOError("CUPS error")
+        self.printed.append(title)
+        self.paths.append(filename)
+        job_id = len(self.printed)
+        self.jobs[job_id] = {'job-id': job_id, 'job-name': title, 'job-state': 5}
+        return job_id
+
+    def getJobs(self, my_jobs=False, requested_attributes=None):
+        return dict(self.jobs)
+
+    def getPrinterAttributes(self, name, requested_attributes=None):
+        return dict(self.attributes)
+
+    def getPPD(self, name):
+        if not self.ppd:
+            raise RuntimeError("No PPD")
+        with open(self.ppd[0], 'w') as fp:
+            fp.write('*PPD-Adobe: "4.3"')
+        return self.ppd[0]
+
+
+class FakeAttribute(object):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class FakePPD(object):
+
+    """PPD file giving the attributes defined in the connection.
+    """
+
+    def __init__(self, filename):
+        self.attributes = FakeConnection.ppd[1]
+        self.defchoice = 'w288h432'
+
+    def findAttr(self, name, spec=None):
+        if name in self.attributes:
+            return FakeAttribute(self.attributes[name])
+        return None
+
+    def findOption(self, name):
+        return self
+
+
+class FakeCups(object):
+
+    Connection = FakeConnection
+    PPD = FakePPD
+
+
+@pytest.fixture
+def fake_printer(monkeypatch):
+    monkeypatch.setattr(printer, 'cups', FakeCups)
+    monkeypatch.setattr(printer, 'Subscriber', lambda conn: None, raising=False)
+    FakeConnection.printed = []
+    FakeConnection.paths = []
+    FakeConnection.jobs = {}
+    FakeConnection.attributes = {}
+    FakeConnection.ppd = None
+    FakeConnection.lock.clear()
+    pygame.init()
+    pygame.event.clear()
+    prt = Printer(max_jobs=2)
+    yield prt
+    FakeConnection.lock.set()
+    prt.quit()
+
+
+def wait_events(count):
+    events = []
+    clock = pygame.time.Clock()
+    for _ in range(200):
+        events.extend(pygame.event.get(PRINTER_TASKS_UPDATED))
+        if len(events) >= count:
+            break
+        clock.tick(100)
+    return events
+
+
+def test_print_queue(fake_printer, tmpdir):
+    paths = [tmpdir.join(name) for name in ('pic1.jpg', 'pic2.jpg', 'error.jpg', 'pic3.jpg')]
+    for path in paths:
+        path.write('')
+
+    assert fake_printer.print_file(str(paths[0]))  # Taken by the worker (blocked by CUPS)
+    while not fake_printer._jobs.empty():
+        time.sleep(0.01)
+    assert fake_printer.print_file(str(paths[1]))
+    assert fake_printer.print_file(str(paths[2]))
+    assert not fake_printer.print_file(str(paths[3]))  # Queue full
+
+    FakeConnection.lock.set()
+    events = wait_events(3)
+    assert [event.filename for event in events] == [str(path) for path in paths[:3]]
+    assert [event.error for event in events] == [None, None, "CUPS error"]
+    assert FakeConnection.printed == ['pic1.jpg', 'pic2.jpg']
+
+
+def test_print_missing_file(fake_printer, tmpdir):
+    with pytest.raises(IOError):
+        fake_printer.print_file(str(tmpdir.join('missing.jpg')))
+
+
+class FakeEvent(object):
+
+    title = "Job completed"
+
+
+def test_tasks_table(fake_printer, tmpdir):
+    path = tmpdir.join('pic1.jpg')
+    path.write('')
+    FakeConnection.lock.set()
+
+    assert fake_printer.get_queue_length() == 0
+    assert fake_printer.print_file(str(path))
+    assert len(wait_events(1)) == 1
+    assert list(fake_printer.get_all_tasks()) == [1]
+    assert fake_printer.get_queue_length() == 1
+
+    FakeConnection.jobs.clear()  # Job completed, CUPS notifies it
+    fake_printer._on_event(FakeEvent())
+    events = wait_events(1)
+    assert [event.evt.title for event in events] == ["Job completed"]
+    assert fake_printer.get_all_tasks() == {}
+    assert fake_printer.get_queue_length() == 0
+
+
+def test_print_sheet(fake_printer, tmpdir):
+    path = str(tmpdir.join('pic1.jpg'))
+    image = Image.new('RGB', (400, 600), (255, 0, 0))
+    image.save(path)
+    FakeConnection.lock.set()
+
+    assert fake_printer.print_file(path, 2, image)
+    assert len(wait_events(1)) == 1
+    assert fake_printer.print_file(path, 2)  # Duplicate, page reused
+    assert len(wait_events(1)) == 1
+    assert FakeConnection.printed == ['pic1.jpg', 'pic1.jpg']
+    sheet = FakeConnection.paths[0]
+    assert FakeConnection.paths == [sheet] * 2
+    assert osp.dirname(sheet) != str(tmpdir)  # Not in the pictures folder
+    with Image.open(sheet) as page:
+        assert sorted(page.size) == [2400, 3600]
+
+    # Page of the previous picture removed
+    path2 = str(tmpdir.join('pic2.jpg'))
+    image.save(path2)
+    assert fake_printer.print_file(path2, 2)
+    assert len(wait_events(1)) == 1
+    assert not osp.isfile(sheet)
+    assert osp.isfile(FakeConnection.paths[-1])
+
+    fake_printer.quit()
+    assert not osp.isfile(FakeConnection.paths[-1])
+    assert sorted(tmpdir.listdir()) == [tmpdir.join('pic1.jpg'), tmpdir.join('pic2.jpg')]
+
+
+def test_profile_default(fake_printer):
+    assert fake_printer.get_profile() == ((4, 6), 600)
+
+
+def test_profile_ipp(fake_printer):
+    FakeConnection.attributes = {'printer-resolution-default': (300, 300, 3),
+                                 'media-default': 'iso_a6_105x148mm'}
+    prt = Printer(paper_format=(5, 7), dpi=400)
+    paper_format, dpi = prt.get_profile()
+    assert dpi == 300
+    assert paper_format == pytest.approx((105 / 25.4, 148 / 25.4))
+
+
+def test_profile_ppd(fake_printer, tmpdir):
+    FakeConnection.attributes = {'media-default': 'na_index-4x6_4x6in'}
+    FakeConnection.ppd = (str(tmpdir.join('fake.ppd')), {'DefaultResolution': '300x300dpi',
+                                                         'ImageableArea': '9 9 279 423'})
+    prt = Printer()
+    assert prt.get_profile() == ((3.75, 5.75), 300)
+    assert not tmpdir.join('fake.ppd').check()  # Temporary file removed
+
+
+def test_print_no_connection(fake_printer, tmpdir, monkeypatch):
+    path = tmpdir.join('pic1.jpg')
+    path.write('')
+    FakeConnection.lock.set()
+
+    def connection_error():
+        raise RuntimeError("CUPS not reachable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(FakeCups, 'Connection', connection_error)
+        assert not fake_printer.print_file(str(path))  # Not counted by the caller
+    assert fake_printer.get_queue_length() == 0
+
+    assert fake_printer.print_file(str(path))  # Worker started
+    assert [event.error for event in wait_events(1)] == [None]
+
+    fake_printer._jobs.put(None)  # Worker stopped
+    fake_printer._worker.join(10)
+    assert fake_printer.print_file(str(path))  # Worker restarted
+    assert [event.error for event in wait_events(1)] == [None]
+    assert FakeConnection.printed == ['pic1.jpg', 'pic1.jpg']
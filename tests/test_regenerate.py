@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import os.path as osp
+from datetime import datetime, timedelta
+import pytest
+from PIL import Image
+from pibooth.scripts.regenerate import regenerate_all_images, load_manifest, parse_profile
+from pibooth.pictures.exif import ORIENTATION_TAG
+
+
+@pytest.fixture
+def config(config):
+    config.set('PICTURE', 'captures', '(1, 2)')
+    config.set('PICTURE', 'footer_text1', 'Regen')
+    return config
+
+
+@pytest.fixture
+def basepath(tmpdir, captures_landscape):
+    for folder in ('2021-01-01-12-00-00', '2021-01-01-13-00-00'):
+        rawdir = tmpdir.join('raw', folder)
+        rawdir.ensure(dir=True)
+        shutil.copy(captures_landscape[0].filename, str(rawdir.join('pibooth001.jpg')))
+    return str(tmpdir)
+
+
+def get_mtimes(basepath):
+    return {name: os.stat(osp.join(basepath, name)).st_mtime_ns
+            for name in os.listdir(basepath) if name.endswith('_pibooth.jpg')}
+
+
+def test_regenerate_incremental(plugin_manager, config, basepath):
+    regenerate_all_images(plugin_manager, config, basepath)
+    mtimes = get_mtimes(basepath)
+    assert len(mtimes) == 2
+    assert sorted(load_manifest(basepath)) == ['2021-01-01-12-00-00_pibooth.jpg', '2021-01-01-13-00-00_pibooth.jpg']
+
+    # Nothing changed
+    regenerate_all_images(plugin_manager, config, basepath)
+    assert get_mtimes(basepath) == mtimes
+
+    # Raw file changed
+    raw = osp.join(basepath, 'raw', '2021-01-01-13-00-00', 'pibooth001.jpg')
+    os.utime(raw, (0, 0))
+    regenerate_all_images(plugin_manager, config, basepath)
+    new_mtimes = get_mtimes(basepath)
+    assert new_mtimes['2021-01-01-12-00-00_pibooth.jpg'] == mtimes['2021-01-01-12-00-00_pibooth.jpg']
+    assert new_mtimes['2021-01-01-13-00-00_pibooth.jpg'] != mtimes['2021-01-01-13-00-00_pibooth.jpg']
+
+    # Settings changed
+    config.set('PICTURE', 'footer_text1', 'Regen 2')
+    regenerate_all_images(plugin_manager, config, basepath)
+    assert all(get_mtimes(basepath)[name] != new_mtimes[name] for name in new_mtimes)
+
+
+def test_regenerate_force_since(plugin_manager, config, basepath):
+    regenerate_all_images(plugin_manager, config, basepath)
+    mtimes = get_mtimes(basepath)
+
+    os.utime(osp.join(basepath, 'raw', '2021-01-01-12-00-00', 'pibooth001.jpg'), (0, 0))
+    regenerate_all_images(plugin_manager, config, basepath, force=True,
+                          since=datetime.now() - timedelta(days=1))
+    new_mtimes = get_mtimes(basepath)
+    assert new_mtimes['2021-01-01-12-00-00_pibooth.jpg'] == mtimes['2021-01-01-12-00-00_pibooth.jpg']
+    assert new_mtimes['2021-01-01-13-00-00_pibooth.jpg'] != mtimes['2021-01-01-13-00-00_pibooth.jpg']
+
+
+def test_regenerate_resume(plugin_manager, config, basepath):
+    regenerate_all_images(plugin_manager, config, basepath)
+    os.remove(osp.join(basepath, '2021-01-01-13-00-00_pibooth.jpg'))
+    mtimes = get_mtimes(basepath)
+
+    regenerate_all_images(plugin_manager, config, basepath)
+    new_mtimes = get_mtimes(basepath)
+    assert new_mtimes['2021-01-01-12-00-00_pibooth.jpg'] == mtimes['2021-01-01-12-00-00_pibooth.jpg']
+    assert '2021-01-01-13-00-00_pibooth.jpg' in new_mtimes
+
+
+def test_regenerate_parallel(plugin_manager, config, basepath):
+    regenerate_all_images(plugin_manager, config, basepath, jobs=2)
+    assert len(get_mtimes(basepath)) == 2
+    assert sorted(load_manifest(basepath)) == ['2021-01-01-12-00-00_pibooth.jpg', '2021-01-01-13-00-00_pibooth.jpg']
+
+
+def test_parse_profile():
+    profile = parse_profile('dpi=150, paper=5x7,option=1,quality=80,dest=web/{folder}.jpg')
+    assert profile == {'dpi': 150, 'paper': '5x7', 'option': 1, 'quality': 80, 'dest': 'web/{folder}.jpg'}
+    assert parse_profile('paper=2.5x3')['paper'] == '2.5x3'
+    for text in ('dpi', 'unknown=1', 'option=3', 'paper=A4'):
+        with pytest.raises(ValueError):
+            parse_profile(text)
+
+
+def test_regenerate_profiles(plugin_manager, config, basepath):
+    profiles = [parse_profile('dpi=100,dest=thumbs/{folder}.png'),
+                parse_profile('dpi=300,quality=80,dest=web/{folder}.jpg'),
+                parse_profile('dpi=300,paper=5x7,dest=strip/{folder}.jpg')]
+    regenerate_all_images(plugin_manager, config, basepath, profiles=profiles)
+    assert len(load_manifest(basepath)) == 6
+
+    with Image.open(osp.join(basepath, 'web', '2021-01-01-12-00-00.jpg')) as image:
+        assert sorted(image.size) == [1200, 1800]
+    with Image.open(osp.join(basepath, 'thumbs', '2021-01-01-12-00-00.png')) as image:
+        assert sorted(image.size) == [400, 600]
+    with Image.open(osp.join(basepath, 'strip', '2021-01-01-12-00-00.jpg')) as image:
+        assert sorted(image.size) == [1500, 2100]
+
+    # Only the missing output is generated
+    web = osp.join(basepath, 'web', '2021-01-01-13-00-00.jpg')
+    mtime = os.stat(web).st_mtime_ns
+    os.remove(osp.join(basepath, 'thumbs', '2021-01-01-13-00-00.png'))
+    regenerate_all_images(plugin_manager, config, basepath, profiles=profiles)
+    assert osp.isfile(osp.join(basepath, 'thumbs', '2021-01-01-13-00-00.png'))
+    assert os.stat(web).st_mtime_ns == mtime
+
+
+def test_regenerate_printer_profile(plugin_manager, config, basepath):
+    config.set('PRINTER', 'dpi', '200')
+    regenerate_all_images(plugin_manager, config, basepath)
+    with Image.open(osp.join(basepath, '2021-01-01-12-00-00_pibooth.jpg')) as image:
+        assert sorted(image.size) == [800, 1200]
+
+
+def test_regenerate_exif_orientation(plugin_manager, config, basepath):
+    raw = osp.join(basepath, 'raw', '2021-01-01-12-00-00', 'pibooth001.jpg')
+    with Image.open(raw) as image:
+        exif = image.getexif()
+        exif[ORIENTATION_TAG] = 6
+        image.save(raw, exif=exif)
+    regenerate_all_images(plugin_manager, config, basepath, profiles=[parse_profile('dpi=200')])
+    with Image.open(osp.join(basepath, '2021-01-01-12-00-00_pibooth.jpg')) as image:
+        assert image.size == (800, 1200)  # Portrait capture
+    with Image.open(osp.join(basepath, '2021-01-01-13-00-00_pibooth.jpg')) as image:
+        assert image.size == (1200, 800)
@@ -4,6 +4,8 @@ import os
 import pytest
 import pygame
 from pibooth.view.window import PiWindow
+from pibooth.view.cache import SurfacesCache
+from pibooth.pictures import build_mipmaps
 
 
 WIN = PiWindow("Test", debug=True)
@@ -77,6 +79,65 @@ def test_print_landscape(init, captures_landscape):
     loop(WIN.show_print, captures_landscape[0])
 
 
+def test_print_mipmaps(init, captures_landscape):
+    image = captures_landscape[0].copy()
+    mipmaps = build_mipmaps(image, WIN.display_size)
+    WIN.set_mipmaps(image, mipmaps)
+    assert WIN._get_nearest_mipmap(image, (10, 10)) is mipmaps[-1]
+    assert WIN._get_nearest_mipmap(image, image.size) is image
+    loop(WIN.show_print, image)
+
+
+def test_intro_animation(init, captures_landscape):
+    frames = [capture.copy() for capture in captures_landscape[:2]]
+    WIN.set_animation(frames)
+    for frame in frames:
+        loop(WIN.show_intro, frame)
+    keys = [WIN._get_foreground_key(frame, WIN.RIGHT)[0] for frame in frames]
+    surfaces = [WIN.cache.get(key) for key in keys]
+    hits = WIN.cache.hits
+    for frame, surface in zip(frames, surfaces):
+        loop(WIN.show_intro, frame)
+        assert WIN.cache.get(WIN._get_foreground_key(frame, WIN.RIGHT)[0]) is surface
+    assert WIN.cache.hits >= hits + 2
+
+    WIN.set_animation([])
+    assert keys[0] not in WIN.cache
+    assert keys[1] in WIN.cache  # Current foreground
+
+
+def test_foreground_cache_key(init, captures_landscape):
+    image = captures_landscape[0].copy()
+    loop(WIN.show_print, image)
+    key, _ = WIN._get_foreground_key(image, WIN.LEFT)
+    assert key in WIN.cache
+
+    loop(WIN.show_intro)
+    del image  # Surfaces of a destroyed image are dropped
+    assert key not in WIN.cache
+
+
+def test_surfaces_cache():
+    cache = SurfacesCache(3 * 100 * 4)
+    for i in range(4):
+        cache.put(('foreground', i), pygame.Surface((10, 10), 0, 32))
+    assert len(cache) == 3
+    assert cache.evictions == 1
+    assert cache.get(('foreground', 0)) is None
+    assert cache.get(('foreground', 1)) is not None
+    cache.put(('background', 'intro'), pygame.Surface((10, 10), 0, 32))
+    assert ('foreground', 2) not in cache  # Least recently used
+    assert cache.nbytes == 3 * 100 * 4
+
+    cache.invalidate('foreground')
+    assert len(cache) == 1
+    assert cache.get_stats() == {'entries': 1, 'nbytes': 400, 'max_bytes': 1200,
+                                 'hits': 1, 'misses': 1, 'evictions': 2}
+
+    cache.put(('background', 'big'), pygame.Surface((100, 100), 0, 32))
+    assert ('background', 'big') not in cache
+
+
 def test_finished(init):
     loop(WIN.show_finished)
 